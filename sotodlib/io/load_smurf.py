@@ -38,6 +38,9 @@ from sotodlib.io.g3tsmurf_db import (
 Session = sessionmaker()
 num_bias_lines = 16
 
+# Use the libyaml safe loader for status frames when PyYAML was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 """
 Actions used to define when observations happen
@@ -127,13 +130,13 @@ def _file_has_end_frames(filename):
                 continue
             if 'AMCc.SmurfProcessor.FileWriter.IsOpen' in frame['status']:
                 status = {}
-                status.update(yaml.safe_load(frame['status']))
+                status.update(yaml.load(frame['status'], Loader=_YamlLoader))
                 if not status['AMCc.SmurfProcessor.FileWriter.IsOpen']:
                     ended = True
                     break
             if 'AMCc.SmurfProcessor.SOStream.open_g3stream' in frame['status']:
                 status = {}
-                status.update(yaml.safe_load(frame['status']))
+                status.update(yaml.load(frame['status'], Loader=_YamlLoader))
                 if not status['AMCc.SmurfProcessor.SOStream.open_g3stream']:
                     ended = True
                     break
@@ -585,9 +588,10 @@ class G3tSmurf:
                     tuneset = ts
 
         if tuneset is None:
-            logger.debug(
-                f"New Tuneset Detected {stream_id}, {ctime}, {[[a.name for a in assign_set]]}"
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"New Tuneset Detected {stream_id}, {ctime}, {[[a.name for a in assign_set]]}"
+                )
             tuneset = TuneSets(
                 name=name,
                 path=tune_path,
@@ -968,7 +972,8 @@ class G3tSmurf:
                     if ctime != np.max(cha_times):
                         continue
                     logger.debug(
-                        f"Add new channel assignment: {stream_id},{ctime}, {path}"
+                        "Add new channel assignment: %s,%s, %s",
+                        stream_id, ctime, path
                     )
                     self.add_new_channel_assignment(
                         stream_id, ctime, fname, path, session
@@ -1003,7 +1008,7 @@ class G3tSmurf:
         ):
             if pattern in fname:
                 try:
-                    logger.debug(f"Add new Tune: {stream_id}, {ctime}, {path}")
+                    logger.debug("Add new Tune: %s, %s, %s", stream_id, ctime, path)
                     self.add_new_tuning(stream_id, ctime, path, session)
                 except Exception as e:
                     self._process_index_error(
@@ -1032,7 +1037,7 @@ class G3tSmurf:
                 try:
                     obs_path = os.listdir(os.path.join(path, "outputs"))
                     logger.debug(
-                        f"Add new Observation: {stream_id}, {ctime}, {obs_path}"
+                        "Add new Observation: %s, %s, %s", stream_id, ctime, obs_path
                     )
                     self.add_new_observation(stream_id, action, ctime, session)
                 except Exception as e:
@@ -1600,7 +1605,7 @@ class SmurfStatus:
                         status["stop"] = frame["time"].time / spt3g_core.G3Units.s
                     else:
                         status["stop"] = frame["time"].time / spt3g_core.G3Units.s
-                    status.update(yaml.safe_load(frame["status"]))
+                    status.update(yaml.load(frame["status"], Loader=_YamlLoader))
                     if frame["dump"]:
                         status["dump_frame"] = True
                         break
@@ -1693,7 +1698,7 @@ class SmurfStatus:
                 cur_file = file
             reader.Seek(frame_info.offset)
             frame = reader.Process(None)[0]
-            status.update(yaml.safe_load(frame["status"]))
+            status.update(yaml.load(frame["status"], Loader=_YamlLoader))
 
         session.close()
         return cls(status)
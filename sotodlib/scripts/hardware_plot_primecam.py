@@ -42,6 +42,11 @@ def main():
         help="Add pixel and polarization labels to the plot."
     )
 
+    parser.add_argument(
+        "--raster-dpi", required=False, default=None, type=float,
+        help="Rasterize the detectors at this resolution (default: vector)."
+    )
+
     args = parser.parse_args()
 
     outfile = args.out
@@ -55,6 +60,7 @@ def main():
 
     print("Generating detector plot...", flush=True)
     plot_detectors(hw.data["detectors"], outfile, width=args.width,
-                   height=args.height, labels=args.labels)
+                   height=args.height, labels=args.labels,
+                   raster_dpi=args.raster_dpi)
 
     return
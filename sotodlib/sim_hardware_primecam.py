@@ -5,23 +5,153 @@
 """Focalplane simulation tools.
 """
 
-import re
+import functools
 
-from collections import OrderedDict
-
-from copy import deepcopy
+import math
 
 import numpy as np
 
-import quaternionarray as qa
-
 from .core import Hardware
 
+# The identity rotation, shared (read-only) by the example detectors.
+_IDENT_QUAT = np.array([0.0, 0.0, 0.0, 1.0])
+_IDENT_QUAT.flags.writeable = False
+
+# Fixed polarization angles and handedness of the 37 pixel sinuous wafer.
+_POL_A_37 = np.array([45.,0.,45.,45.,45.,45.,0.,0.,0.,45.,45.,0.,0.,0.,45.,45.,0.,0.,0.,
+                      45.,0.,0.,45.,45.,0.,0.,0.,0.,0.,0.,45.,45.,0.,0.,45.,45.,45.])
+_POL_A_37.flags.writeable = False
+_POL_B_37 = 90.0 + _POL_A_37
+_POL_B_37.flags.writeable = False
+_HANDED_37 = ("R","L","R","L","L","R","L","R","L","R","L","R","R","R","L","R","L","R","R",
+              "L","R","L","R","L","R","L","L","L","L","R","L","R","L","R","L","L","L")
+
 # FIXME:  much of this code is copy/pasted from the toast source, simply to
 # avoid a dependency.  Once we can "pip install toast", we should consider
 # just calling that package.
 
 
+def _quat_mul_batch(p, q):
+    """Multiply arrays of quaternions.
+
+    This computes the same Hamilton product as qa.mult() on the (x, y, z, w)
+    component columns directly, which avoids the per-call array setup of the
+    general function.  The inputs are broadcast against each other.
+
+    Args:
+        p (array): The left quaternion(s), with shape (..., 4).
+        q (array): The right quaternion(s), with shape (..., 4).
+
+    Returns:
+        (array): The products, with the broadcast shape of the inputs.
+
+    """
+    p = np.asarray(p, dtype=np.float64)
+    q = np.asarray(q, dtype=np.float64)
+    p0, p1, p2, p3 = p[..., 0], p[..., 1], p[..., 2], p[..., 3]
+    q0, q1, q2, q3 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    out = np.empty(np.broadcast_shapes(p.shape, q.shape), dtype=np.float64)
+    out[..., 0] = p0 * q3 + p3 * q0 + p1 * q2 - p2 * q1
+    out[..., 1] = p1 * q3 + p3 * q1 + p2 * q0 - p0 * q2
+    out[..., 2] = p2 * q3 + p3 * q2 + p0 * q1 - p1 * q0
+    out[..., 3] = p3 * q3 - p0 * q0 - p1 * q1 - p2 * q2
+    return out
+
+
+def _normalize_rows(vecs):
+    """Normalize each row of an array of vectors.
+
+    Each row is first scaled by its largest absolute component, so that
+    squaring the components can neither overflow nor underflow.  Rows of
+    zeros are left unchanged.
+
+    Args:
+        vecs (array): The vectors, with shape (N, M).
+
+    Returns:
+        (array): The unit vectors.
+
+    """
+    vecs = np.asarray(vecs, dtype=np.float64)
+    scale = np.max(np.abs(vecs), axis=1, keepdims=True)
+    scale[scale == 0] = 1.0
+    scaled = vecs / scale
+    norm = np.linalg.norm(scaled, axis=1, keepdims=True)
+    norm[norm == 0] = 1.0
+    return scaled / norm
+
+
+def _quat_from_zaxis(vecs):
+    """Compute the rotations from the Z axis to an array of vectors.
+
+    This is the vectorized equivalent of qa.from_vectors(zaxis, v) for unit
+    vectors "v".  With one vector fixed to the Z axis, the shortest-arc
+    quaternion is simply the normalized (-y, x, 0, 1 + z).  Vectors pointing
+    along -Z (where that is degenerate) get a rotation of pi about X.
+
+    Args:
+        vecs (array): The unit vectors, with shape (N, 3).
+
+    Returns:
+        (array): The quaternions, with shape (N, 4).
+
+    """
+    vecs = np.asarray(vecs, dtype=np.float64)
+    out = np.zeros((len(vecs), 4), dtype=np.float64)
+    out[:, 0] = -vecs[:, 1]
+    out[:, 1] = vecs[:, 0]
+    out[:, 3] = 1.0 + vecs[:, 2]
+    norm = np.linalg.norm(out, axis=1, keepdims=True)
+    antipodal = norm[:, 0] < 1.0e-15
+    norm[antipodal] = 1.0
+    out /= norm
+    out[antipodal] = np.array([1.0, 0.0, 0.0, 0.0])
+    return out
+
+
+def _quat_rot_z(angles):
+    """Compute rotations about the Z axis.
+
+    This is the equivalent of qa.rotation(zaxis, angles), written out for
+    the fixed axis.
+
+    Args:
+        angles (float or array): The rotation angle(s) in radians.
+
+    Returns:
+        (array): The quaternions, with shape angles.shape + (4,).
+
+    """
+    half = 0.5 * np.asarray(angles, dtype=np.float64)
+    out = np.zeros(half.shape + (4,), dtype=np.float64)
+    out[..., 2] = np.sin(half)
+    out[..., 3] = np.cos(half)
+    return out
+
+
+def _rotate_vec_by_quat(q, v):
+    """Rotate vectors by quaternions.
+
+    This applies v' = v + 2w (u x v) + 2u x (u x v) for q = (u, w), which is
+    equivalent to (but cheaper than) the sandwich product q v q^-1 of
+    qa.rotate().  The inputs are broadcast against each other.
+
+    Args:
+        q (array): The unit quaternion(s), with shape (..., 4).
+        v (array): The vector(s), with shape (..., 3).
+
+    Returns:
+        (array): The rotated vectors.
+
+    """
+    q = np.asarray(q, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    u = q[..., :3]
+    w = q[..., 3:]
+    t = 2.0 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
 def ang_to_quat(offsets):
     """Convert cartesian angle offsets and rotation into quaternions.
 
@@ -32,28 +162,21 @@ def ang_to_quat(offsets):
     location.
 
     Args:
-        offsets (list of arrays):  Each item of the list has 3 elements for
+        offsets (array):  Array of shape (N, 3) (or a list of N arrays) with
             the X / Y angle offsets in radians and the rotation in radians
             about the Z axis.
 
     Returns:
-        (list): List of quaternions, one for each item in the input list.
+        (array): Array of shape (N, 4) with one quaternion for each offset.
 
     """
-    out = list()
-
-    zaxis = np.array([0, 0, 1], dtype=np.float64)
-
-    for off in offsets:
-        angrot = qa.rotation(zaxis, off[2])
-        wx = np.sin(off[0])
-        wy = np.sin(off[1])
-        wz = np.sqrt(1.0 - (wx*wx + wy*wy))
-        wdir = np.array([wx, wy, wz])
-        posrot = qa.from_vectors(zaxis, wdir)
-        out.append(qa.mult(posrot, angrot))
-
-    return out
+    off = np.asarray(offsets, dtype=np.float64).reshape((-1, 3))
+    angrot = _quat_rot_z(off[:, 2])
+    wx = np.sin(off[:, 0])
+    wy = np.sin(off[:, 1])
+    wz = np.sqrt(1.0 - (wx*wx + wy*wy))
+    posrot = _quat_from_zaxis(np.stack([wx, wy, wz], axis=1))
+    return _quat_mul_batch(posrot, angrot)
 
 
 def hex_nring(npos):
@@ -69,17 +192,83 @@ def hex_nring(npos):
         (int): The number of rings.
 
     """
-    test = npos - 1
-    nrings = 1
-    while (test - 6 * nrings) >= 0:
-        test -= 6 * nrings
-        nrings += 1
-    if test != 0:
+    # A layout with N rings has 1 + 3N(N-1) positions, so that
+    # 1 + 4(npos - 1)/3 must be the perfect square (2N - 1)^2.
+    nrings = 0
+    if npos > 0 and (npos - 1) % 3 == 0:
+        rt = math.isqrt(1 + 4 * (npos - 1) // 3)
+        nrings = (rt + 1) // 2
+    if nrings == 0 or 1 + 3 * nrings * (nrings - 1) != npos:
         raise RuntimeError("{} is not a valid number of positions for a "
                            "hexagonal layout".format(npos))
     return nrings
 
 
+def _hex_ring_sector(pos):
+    """Return the ring, sector and sector step of hexagon positions.
+
+    Positions are indexed in the "spiral" scheme of hex_layout.  Ring "R"
+    holds positions 3R(R-1)+1 ... 3R(R+1), so the ring follows from
+    inverting that quadratic.
+
+    Args:
+        pos (array): The (non-zero) positions.
+
+    Returns:
+        (tuple): The (ring, sector, steps) integer arrays.
+
+    """
+    pos = np.asarray(pos, dtype=np.int64)
+    ring = np.floor(
+        0.5 * (1.0 + np.sqrt(1.0 + 4.0 * (pos - 1) / 3.0))
+    ).astype(np.int64)
+    # Guard against round-off right at the ring boundaries.
+    ring[3 * ring * (ring - 1) > pos - 1] -= 1
+    ring[3 * ring * (ring + 1) <= pos - 1] += 1
+    test = pos - 1 - 3 * ring * (ring - 1)
+    return ring, test // ring, test % ring
+
+
+@functools.lru_cache(maxsize=None)
+def _hex_row_col_table(npos):
+    """Return the row and column of every position in a hexagon.
+
+    This is the vectorized equivalent of calling hex_row_col() for each
+    position.  The result is cached, and the returned arrays are read-only.
+
+    Args:
+        npos (int): The number of positions.
+
+    Returns:
+        (tuple): The (rows, cols) integer arrays, one element per position.
+
+    """
+    nrings = hex_nring(npos)
+    rows = np.zeros(npos, dtype=np.int64)
+    cols = np.full(npos, nrings - 1, dtype=np.int64)
+    if npos > 1:
+        ring, sector, steps = _hex_ring_sector(np.arange(1, npos))
+        coloff = nrings - ring - 1
+        rows[1:] = np.choose(
+            sector,
+            [steps, ring, ring - steps, -steps, -ring, -ring + steps],
+        )
+        cols[1:] = np.choose(
+            sector,
+            [
+                coloff + 2 * ring - steps,
+                coloff + ring - steps,
+                coloff,
+                coloff,
+                coloff + steps,
+                coloff + ring + steps,
+            ],
+        )
+    rows.flags.writeable = False
+    cols.flags.writeable = False
+    return rows, cols
+
+
 def hex_row_col(npos, pos):
     """Return the location of a given position.
 
@@ -98,42 +287,24 @@ def hex_row_col(npos, pos):
     """
     if pos >= npos:
         raise ValueError("position value out of range")
-    test = npos - 1
-    nrings = 1
-    while (test - 6 * nrings) >= 0:
-        test -= 6 * nrings
-        nrings += 1
-    if pos == 0:
-        row = 0
-        col = nrings - 1
-    else:
-        test = pos - 1
-        ring = 1
-        while (test - 6 * ring) >= 0:
-            test -= 6 * ring
-            ring += 1
-        sector = int(test / ring)
-        steps = np.mod(test, ring)
-        coloff = nrings - ring - 1
-        if sector == 0:
-            row = steps
-            col = coloff + 2*ring - steps
-        elif sector == 1:
-            row = ring
-            col = coloff + ring - steps
-        elif sector == 2:
-            row = ring - steps
-            col = coloff
-        elif sector == 3:
-            row = -steps
-            col = coloff
-        elif sector == 4:
-            row = -ring
-            col = coloff + steps
-        elif sector == 5:
-            row = -ring + steps
-            col = coloff + ring + steps
-    return (row, col)
+    rows, cols = _hex_row_col_table(npos)
+    return (int(rows[pos]), int(cols[pos]))
+
+
+def _as_key(values, dtype=np.float64):
+    """Convert an optional array argument into a hashable cache key.
+
+    Args:
+        values (array): The values, or None.
+        dtype (dtype): The type of the values.
+
+    Returns:
+        (tuple): The values as a tuple, or None.
+
+    """
+    if values is None:
+        return None
+    return tuple(np.asarray(values, dtype=dtype).tolist())
 
 
 def hex_layout(npos, width, rotate=None):
@@ -163,7 +334,18 @@ def hex_layout(npos, width, rotate=None):
         (array): Array of quaternions for the positions.
 
     """
-    zaxis = np.array([0, 0, 1], dtype=np.float64)
+    return _hex_layout(npos, float(width), _as_key(rotate)).copy()
+
+
+@functools.lru_cache(maxsize=64)
+def _hex_layout(npos, width, rotate):
+    """Cached implementation of hex_layout().
+
+    The rotate argument must be a tuple (or None), and the returned array is
+    read-only.  Identical wafers share the same layout, so this avoids
+    recomputing it for every wafer of a given type.
+
+    """
     nullquat = np.array([0, 0, 0, 1], dtype=np.float64)
     sixty = np.pi/3.0
     thirty = np.pi/6.0
@@ -178,69 +360,64 @@ def hex_layout(npos, width, rotate=None):
 
     result = np.zeros((npos, 4), dtype=np.float64)
 
-    for pos in range(npos):
-        if pos == 0:
-            # center position has no offset
-            posrot = nullquat
-        else:
-            # Not at the center, find ring for this position
-            test = pos - 1
-            ring = 1
-            while (test - 6 * ring) >= 0:
-                test -= 6 * ring
-                ring += 1
-            sectors = int(test / ring)
-            sectorsteps = np.mod(test, ring)
-
-            # Convert angular steps around the ring into the angle and distance
-            # in polar coordinates.  Each "sector" of 60 degrees is essentially
-            # an equilateral triangle, and each step is equally spaced along
-            # the edge opposite the vertex:
-            #
-            #          O
-            #         O O (step 2)
-            #        O   O (step 1)
-            #       X O O O (step 0)
-            #
-            # For a given ring, "R" (center is R=0), there are R steps along
-            # the sector edge.  The line from the origin to the opposite edge
-            # that bisects this triangle has length R*sqrt(3)/2.  For each
-            # equally-spaced step, we use the right triangle formed with this
-            # bisection line to compute the angle and radius within this
-            # sector.
-
-            # The distance from the origin to the midpoint of the opposite
-            # side.
-            midline = rtthreebytwo * float(ring)
-
-            # the distance along the opposite edge from the midpoint (positive
-            # or negative)
-            edgedist = float(sectorsteps) - 0.5 * float(ring)
-
-            # the angle relative to the midpoint line (positive or negative)
-            relang = np.arctan2(edgedist, midline)
-
-            # total angle is based on number of sectors we have and the angle
-            # within the final sector.
-            posang = sectors * sixty + thirty + relang
-
-            posdist = rtthreebytwo * posdiam * float(ring) / np.cos(relang)
-
-            posx = np.sin(posdist) * np.cos(posang)
-            posy = np.sin(posdist) * np.sin(posang)
-            posz = np.cos(posdist)
-            posdir = np.array([posx, posy, posz], dtype=np.float64)
-            norm = np.sqrt(np.dot(posdir, posdir))
-            posdir /= norm
-
-            posrot = qa.from_vectors(zaxis, posdir)
-
-        if rotate is None:
-            result[pos] = posrot
-        else:
-            prerot = qa.rotation(zaxis, rotate[pos] * np.pi / 180.0)
-            result[pos] = qa.mult(posrot, prerot)
-
+    # center position has no offset
+    result[0] = nullquat
+
+    if npos > 1:
+        # Not at the center, find ring for every other position.
+        ring, sectors, sectorsteps = _hex_ring_sector(np.arange(1, npos))
+
+        # Convert angular steps around the ring into the angle and distance
+        # in polar coordinates.  Each "sector" of 60 degrees is essentially
+        # an equilateral triangle, and each step is equally spaced along
+        # the edge opposite the vertex:
+        #
+        #          O
+        #         O O (step 2)
+        #        O   O (step 1)
+        #       X O O O (step 0)
+        #
+        # For a given ring, "R" (center is R=0), there are R steps along
+        # the sector edge.  The line from the origin to the opposite edge
+        # that bisects this triangle has length R*sqrt(3)/2.  For each
+        # equally-spaced step, we use the right triangle formed with this
+        # bisection line to compute the angle and radius within this
+        # sector.
+
+        # The distance from the origin to the midpoint of the opposite
+        # side.
+        midline = rtthreebytwo * ring
+
+        # the distance along the opposite edge from the midpoint (positive
+        # or negative)
+        edgedist = sectorsteps - 0.5 * ring
+
+        # the angle relative to the midpoint line (positive or negative)
+        relang = np.arctan2(edgedist, midline)
+
+        # total angle is based on number of sectors we have and the angle
+        # within the final sector.
+        posang = sectors * sixty + thirty + relang
+
+        posdist = rtthreebytwo * posdiam * ring / np.cos(relang)
+
+        posdir = np.stack(
+            [
+                np.sin(posdist) * np.cos(posang),
+                np.sin(posdist) * np.sin(posang),
+                np.cos(posdist),
+            ],
+            axis=1,
+        )
+        posdir = _normalize_rows(posdir)
+
+        result[1:] = _quat_from_zaxis(posdir)
+
+    if rotate is not None:
+        prerot = _quat_rot_z(np.asarray(rotate) * np.pi / 180.0)
+        result = _quat_mul_batch(result, prerot)
+
+    result.flags.writeable = False
     return result
 
 
@@ -297,6 +474,29 @@ def rhomb_row_col(npos, pos):
     return (row, col)
 
 
+def _rhomb_row_col_table(dim):
+    """Return the row and column of every position in a rhombus.
+
+    This is the vectorized equivalent of calling rhomb_row_col() for each
+    position of a rhombus with the given side dimension.
+
+    Args:
+        dim (int): The dimension of one side.
+
+    Returns:
+        (tuple): The (rows, cols) integer arrays, one element per position.
+
+    """
+    # Rows grow by one position down to the widest row and then shrink.
+    rowcnt = np.concatenate(
+        [np.arange(1, dim + 1), np.arange(dim - 1, 0, -1)]
+    ).astype(np.int64)
+    rowstart = np.cumsum(rowcnt) - rowcnt
+    rows = np.repeat(np.arange(len(rowcnt), dtype=np.int64), rowcnt)
+    cols = np.arange(dim * dim, dtype=np.int64) - rowstart[rows]
+    return rows, cols
+
+
 def rhombus_layout(npos, width, rotate=None):
     """Compute positions in a hexagon layout.
 
@@ -335,7 +535,6 @@ def rhombus_layout(npos, width, rotate=None):
         (array): Array of quaternions for the positions.
 
     """
-    zaxis = np.array([0, 0, 1], dtype=np.float64)
     rtthree = np.sqrt(3.0)
 
     angwidth = width * np.pi / 180.0
@@ -344,33 +543,42 @@ def rhombus_layout(npos, width, rotate=None):
     # find the angular packing size of one detector
     posdiam = angwidth / (dim - 1)
 
-    result = np.zeros((npos, 4), dtype=np.float64)
+    posrow, poscol = _rhomb_row_col_table(dim)
 
-    for pos in range(npos):
-        posrow, poscol = rhomb_row_col(npos, pos)
+    rowang = 0.5 * rtthree * ((dim - 1) - posrow) * posdiam
+    relrow = np.where(posrow >= dim, (2 * dim - 2) - posrow, posrow)
+    colang = (poscol - 0.5 * relrow) * posdiam
+    distang = np.sqrt(rowang**2 + colang**2)
+    zang = np.cos(distang)
+    posdir = np.stack([colang, rowang, zang], axis=1)
+    posdir = _normalize_rows(posdir)
 
-        rowang = 0.5 * rtthree * ((dim - 1) - posrow) * posdiam
-        relrow = posrow
-        if posrow >= dim:
-            relrow = (2 * dim - 2) - posrow
-        colang = (float(poscol) - float(relrow) / 2.0) * posdiam
-        distang = np.sqrt(rowang**2 + colang**2)
-        zang = np.cos(distang)
-        posdir = np.array([colang, rowang, zang], dtype=np.float64)
-        norm = np.sqrt(np.dot(posdir, posdir))
-        posdir /= norm
+    result = _quat_from_zaxis(posdir)
 
-        posrot = qa.from_vectors(zaxis, posdir)
-
-        if rotate is None:
-            result[pos] = posrot
-        else:
-            prerot = qa.rotation(zaxis, rotate[pos] * np.pi / 180.0)
-            result[pos] = qa.mult(posrot, prerot)
+    if rotate is not None:
+        prerot = _quat_rot_z(np.asarray(rotate) * np.pi / 180.0)
+        result = _quat_mul_batch(result, prerot)
 
     return result
 
 
+def _keep_mask(npos, killpix):
+    """Return a boolean mask of the positions that are not removed.
+
+    Args:
+        npos (int): The number of positions.
+        killpix (list): Position indices to remove, or None.
+
+    Returns:
+        (array): Boolean array which is False for the removed positions.
+
+    """
+    keep = np.ones(npos, dtype=bool)
+    if killpix is not None:
+        keep[np.asarray(killpix, dtype=np.int64)] = False
+    return keep
+
+
 def rhombus_hex_layout(rhombus_npos, rhombus_width, gap, rhombus_rotate=None,
                        killpix=None):
     """
@@ -390,6 +598,21 @@ def rhombus_hex_layout(rhombus_npos, rhombus_width, gap, rhombus_rotate=None,
     Returns:
         (dict): Keys are the hexagon position and values are quaternions.
 
+    """
+    return _rhombus_hex_layout(
+        rhombus_npos, float(rhombus_width), float(gap),
+        _as_key(rhombus_rotate), _as_key(killpix, dtype=np.int64),
+    ).copy()
+
+
+@functools.lru_cache(maxsize=64)
+def _rhombus_hex_layout(rhombus_npos, rhombus_width, gap, rhombus_rotate,
+                        killpix):
+    """Cached implementation of rhombus_hex_layout().
+
+    The rhombus_rotate and killpix arguments must be tuples (or None), and
+    the returned array is read-only.
+
     """
     sixty = np.pi / 3.0
     thirty = np.pi / 6.0
@@ -417,36 +640,33 @@ def rhombus_hex_layout(rhombus_npos, rhombus_width, gap, rhombus_rotate=None,
     # in the X direction for the "vertical" rhombus.
     shift = halfwidth + (0.5 * pixwidth) + ((0.5 * gap) / np.cos(thirty))
 
-    centers = [
-        np.array([shift, 0.0, 0.0]),
-        np.array([-shift * np.cos(sixty), shift * np.sin(sixty),
-                  2 * sixty]),
-        np.array([-shift * np.cos(sixty), -shift * np.sin(sixty),
-                  4 * sixty])
-    ]
+    centers = np.array([
+        [shift, 0.0, 0.0],
+        [-shift * np.cos(sixty), shift * np.sin(sixty), 2 * sixty],
+        [-shift * np.cos(sixty), -shift * np.sin(sixty), 4 * sixty],
+    ])
     qcenters = ang_to_quat(centers)
 
-    nkill = len(killpix)
-    result = np.zeros((3 * rhombus_npos - nkill, 4), dtype=np.float64)
-
-    off = 0
-    px = 0
-    for qc in qcenters:
-        for p in range(rhombus_npos):
-            if px not in killpix:
-                result[off] = qa.mult(qc, rquat[p])
-                off += 1
-            px += 1
+    # Rotate all three copies of the rhombus into place in one batch.
+    result = _quat_mul_batch(
+        np.repeat(qcenters, rhombus_npos, axis=0),
+        np.tile(rquat, (3, 1)),
+    )
 
+    result = result[_keep_mask(3 * rhombus_npos, killpix)]
+    result.flags.writeable = False
     return result
 
 
-def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
-                        center=np.array([0, 0, 0, 1], dtype=np.float64)):
-    """Generate detector properties for a wafer.
+def sim_wafer_detector_table(hw, wafer_slot, platescale, fwhm, band=None,
+                             center=np.array([0, 0, 0, 1], dtype=np.float64),
+                             boresight=False):
+    """Generate a table of detector properties for a wafer.
 
-    Given a Hardware configuration, generate all detector properties for
-    the specified wafer and optionally only the specified band.
+    This computes the same detector properties as sim_wafer_detectors(), but
+    returns them as one array (or list) per property, with one element per
+    detector.  The "name" column contains the detector names.  The "handed"
+    column is only present for wafers with sinuous packing.
 
     Args:
         hw (Hardware): The hardware properties.
@@ -456,9 +676,12 @@ def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
             each band.
         band (str, optional): Optionally only use this band.
         center (array, optional): The quaternion offset of the center.
+        boresight (bool, optional): If True, also return a "boresight"
+            column with the (ndet, 3) line of sight unit vectors of the
+            detectors.
 
     Returns:
-        (OrderedDict): The properties of all selected detectors.
+        (dict): The property columns of all selected detectors.
 
     """
     # The properties of this wafer
@@ -497,17 +720,11 @@ def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
         # degrees.  However there is an offset.  We choose this arbitrarily
         # for the nominal rhombus position, and then the rotation of the
         # other 2 rhombi will naturally modulate this.
-        pol_A = np.zeros(nrhombus, dtype=np.float64)
-        pol_B = np.zeros(nrhombus, dtype=np.float64)
         poloff = 22.5
-        for p in range(nrhombus):
-            # get the row / col of the pixel
-            row, col = rhomb_row_col(nrhombus, p)
-            if np.mod(row, 2) == 0:
-                pol_A[p] = 0.0 + poloff
-            else:
-                pol_A[p] = 45.0 + poloff
-            pol_B[p] = 90.0 + pol_A[p]
+        # get the row / col of the pixels
+        row, col = _rhomb_row_col_table(dim)
+        pol_A = np.where(row % 2 == 0, 0.0, 45.0) + poloff
+        pol_B = 90.0 + pol_A
         # We are going to remove 2 pixels for mechanical reasons
         kf = dim * (dim - 1) // 2
         kill = [(dim*dim+kf), (dim*dim+kf) + dim - 2]
@@ -525,26 +742,14 @@ def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
         # changes every other column
 
         if npix==37:
-            pol_A=np.array([45.,0.,45.,45.,45.,45.,0.,0.,0.,45.,45.,0.,0.,0.,45.,45.,0.,0.,0.,
-                            45.,0.,0.,45.,45.,0.,0.,0.,0.,0.,0.,45.,45.,0.,0.,45.,45.,45.])
-            handed=["R","L","R","L","L","R","L","R","L","R","L","R","R","R","L","R","L","R","R",
-                    "L","R","L","R","L","R","L","L","L","L","R","L","R","L","R","L","L","L"]
-            pol_B=90.0+pol_A
+            pol_A = _POL_A_37
+            pol_B = _POL_B_37
+            handed = _HANDED_37
         else:
-            handed = list()
-            pol_A = np.zeros(npix, dtype=np.float64)
-            pol_B = np.zeros(npix, dtype=np.float64)
-            for p in range(npix):
-                row, col = hex_row_col(npix, p)
-                if np.mod(col, 2) == 0:
-                    handed.append("L")
-                else:
-                    handed.append("R")
-                if np.mod(col, 4) < 2:
-                    pol_A[p] = 0.0
-                else:
-                    pol_A[p] = 45.0
-                pol_B[p] = 90.0 + pol_A[p]
+            row, col = _hex_row_col_table(npix)
+            handed = np.where(col % 2 == 0, "L", "R").tolist()
+            pol_A = np.where(col % 4 < 2, 0.0, 45.0)
+            pol_B = 90.0 + pol_A
         layout_A = hex_layout(npix, width, rotate=pol_A)
         layout_B = hex_layout(npix, width, rotate=pol_B)
     else:
@@ -552,8 +757,8 @@ def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
             "Unknown wafer packing '{}'".format(wprops["packing"]))
 
     # Now we go through each pixel and create the orthogonal detectors for
-    # each band.
-    dets = OrderedDict()
+    # each band.  Detectors are ordered by pixel, then band, then
+    # polarization.
 
     #chan_per_AMC = cardprops["nchannel"] // cardprops["nAMC"]
     chan_per_AMC = 910
@@ -561,48 +766,120 @@ def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
     chan_per_bias = cardprops["nchannel"] // cardprops["nbias"]
     readout_freq_range=np.linspace(4.,6.,chan_per_AMC)
     readout_freq=np.append(readout_freq_range,readout_freq_range)
-    
-    doff = 0
-    p = 0
+
+    # The layouts only contain the pixels which were kept.
+    npix_keep = np.count_nonzero(_keep_mask(npix, kill))
+    nband = len(bands)
+    ndet = npix_keep * nband * 2
+    det_pix = np.repeat(np.arange(npix_keep), nband * 2)
+    det_band = np.tile(np.repeat(np.arange(nband), 2), npix_keep)
+    det_pol = np.tile(np.arange(2), npix_keep * nband)
+
+    # Layout quaternion offsets are from the origin.  Now we apply the
+    # rotation of the wafer center to all pixels at once.
+    quat_A = _quat_mul_batch(np.ravel(center), layout_A)
+    quat_B = _quat_mul_batch(np.ravel(center), layout_B)
+    quat = np.where(
+        (det_pol == 0)[:, np.newaxis], quat_A[det_pix], quat_B[det_pix]
+    )
+
+    # Build all the strings once per pixel and once per band / polarization
+    # combination, and combine them as arrays.
+    pstr = np.char.zfill(np.arange(npix_keep).astype(str), 3)
+    band_names = list(bands)
+    pol_names = ["A", "B"]
+    suffix = np.array(
+        ["_{}_{}".format(b, pl) for b in band_names for pl in pol_names]
+    )
+
     idoff = int(wafer_slot[-2:]) * 10000
-    for px in range(npix):
-        if px in kill:
-            continue
-        pstr = "{:03d}".format(p)
-        for b in bands:
-            for pl, layout, pol in zip(
-                    ["A", "B"], [layout_A, layout_B], [pol_A, pol_B],
-            ):
-                dprops = OrderedDict()
-                dprops["wafer_slot"] = wafer_slot
-                dprops["ID"] = idoff + doff
-                dprops["pixel"] = pstr
-                dprops["band"] = b
-                dprops["fwhm"] = fwhm[b]
-                dprops["pol"] = pl
-                if handed is not None:
-                    dprops["handed"] = handed[p]
-                # Made-up assignment to readout channels
-                dprops["card_slot"] = card_slot
-                dprops["channel"] = doff
-                dprops["AMC"] = doff // chan_per_AMC
-                dprops["bias"] = doff // chan_per_bias
-                #Commented out because it's limited to SO channel counts
-                #dprops["readout_freq_GHz"] = readout_freq[doff]
-                dprops["bondpad"] = doff-(doff//chan_per_mux)*chan_per_mux
-                dprops["mux_position"] = doff//chan_per_mux
-                # Layout quaternion offset is from the origin.  Now we apply
-                # the rotation of the wafer center.
-                dprops["quat"] = qa.mult(center, layout[p]).flatten()
-                dprops["detector_name"]= ""
-                dname = "{}_p{}_{}_{}".format(wafer_slot, pstr, b, pl)
-                dets[dname] = dprops
-                doff += 1
-        p += 1
+    chan = np.arange(ndet, dtype=np.int64)
+
+    table = dict()
+    table["name"] = np.char.add(
+        np.char.add("{}_p".format(wafer_slot), pstr[:, np.newaxis]),
+        suffix[np.newaxis, :],
+    ).ravel().tolist()
+    table["wafer_slot"] = [wafer_slot] * ndet
+    table["ID"] = idoff + chan
+    table["pixel"] = pstr[det_pix].tolist()
+    table["band"] = np.array(band_names)[det_band].tolist()
+    table["fwhm"] = np.fromiter(
+        (fwhm[b] for b in band_names), dtype=np.float64, count=nband
+    )[det_band]
+    table["pol"] = np.array(pol_names)[det_pol].tolist()
+    if handed is not None:
+        table["handed"] = np.asarray(handed)[det_pix].tolist()
+    # Made-up assignment to readout channels
+    table["card_slot"] = [card_slot] * ndet
+    table["channel"] = chan
+    table["AMC"] = chan // chan_per_AMC
+    table["bias"] = chan // chan_per_bias
+    #Commented out because it's limited to SO channel counts
+    #table["readout_freq_GHz"] = readout_freq[chan]
+    table["bondpad"] = chan % chan_per_mux
+    table["mux_position"] = chan // chan_per_mux
+    table["quat"] = quat
+    table["detector_name"] = [""] * ndet
+    if boresight:
+        table["boresight"] = _rotate_vec_by_quat(
+            quat, np.array([0.0, 0.0, 1.0])
+        )
+    return table
+
+
+def _table_to_dets(table):
+    """Convert a table of detector properties into per-detector dictionaries.
+
+    Args:
+        table (dict): One array or list per property, with one element per
+            detector.  The "name" column contains the detector names and
+            every other column becomes a detector property.
 
+    Returns:
+        (dict): The properties of each detector, keyed by detector name.
+
+    """
+    keys = [k for k in table.keys() if k != "name"]
+    # Convert numeric columns to python types (except the quaternions) so
+    # that the per-detector properties are the same as when built by hand.
+    cols = [
+        table[k] if (k == "quat" or isinstance(table[k], list))
+        else table[k].tolist()
+        for k in keys
+    ]
+    dets = dict()
+    for dname, row in zip(table["name"], zip(*cols)):
+        dets[dname] = dict(zip(keys, row))
     return dets
 
 
+def sim_wafer_detectors(hw, wafer_slot, platescale, fwhm, band=None,
+                        center=np.array([0, 0, 0, 1], dtype=np.float64)):
+    """Generate detector properties for a wafer.
+
+    Given a Hardware configuration, generate all detector properties for
+    the specified wafer and optionally only the specified band.
+
+    Args:
+        hw (Hardware): The hardware properties.
+        wafer_slot (str): The wafer slot name.
+        platescale (float): The plate scale in degrees / mm.
+        fwhm (dict): Dictionary of nominal FWHM values in arcminutes for
+            each band.
+        band (str, optional): Optionally only use this band.
+        center (array, optional): The quaternion offset of the center.
+
+    Returns:
+        (dict): The properties of all selected detectors.
+
+    """
+    table = sim_wafer_detector_table(
+        hw, wafer_slot, platescale, fwhm, band=band, center=center
+    )
+    return _table_to_dets(table)
+
+
 def sim_telescope_detectors(hw, tele, tube_slots=None):
     """Generate detector properties for a telescope.
 
@@ -615,10 +892,9 @@ def sim_telescope_detectors(hw, tele, tube_slots=None):
         tube_slots (list, optional): The optional list of tube slots to include.
 
     Returns:
-        (OrderedDict): The properties of all selected detectors.
+        (dict): The properties of all selected detectors.
 
     """
-    zaxis = np.array([0, 0, 1], dtype=np.float64)
     thirty = np.pi / 6.0
     # The properties of this telescope
     teleprops = hw.data["telescopes"][tele]
@@ -631,27 +907,28 @@ def sim_telescope_detectors(hw, tele, tube_slots=None):
     if tube_slots is None:
         tube_slots = alltubes
     else:
+        valid_tubes = frozenset(alltubes)
         for t in tube_slots:
-            if t not in alltubes:
+            if t not in valid_tubes:
                 raise RuntimeError("Invalid tube_slot '{}' for telescope '{}'"
                                    .format(t, tele))
 
-    alldets = OrderedDict()
+    alldets = dict()
     if ntube == 1:
         # This is a SAT.  We have one tube at the center.
         tubeprops = hw.data["tube_slots"][tube_slots[0]]
         waferspace = tubeprops["waferspace"]
 
         shift = waferspace * platescale * np.pi / 180.0
-        wcenters = [
-            np.array([0.0, 0.0, 0.0]),
-            np.array([shift * np.cos(thirty), shift * np.sin(thirty), 0.0]),
-            np.array([0.0, shift, 0.0]),
-            np.array([-shift * np.cos(thirty), shift * np.sin(thirty), 0.0]),
-            np.array([-shift * np.cos(thirty), -shift * np.sin(thirty), 0.0]),
-            np.array([0.0, -shift, 0.0]),
-            np.array([shift * np.cos(thirty), -shift * np.sin(thirty), 0.0])
-        ]
+        wcenters = np.array([
+            [0.0, 0.0, 0.0],
+            [shift * np.cos(thirty), shift * np.sin(thirty), 0.0],
+            [0.0, shift, 0.0],
+            [-shift * np.cos(thirty), shift * np.sin(thirty), 0.0],
+            [-shift * np.cos(thirty), -shift * np.sin(thirty), 0.0],
+            [0.0, -shift, 0.0],
+            [shift * np.cos(thirty), -shift * np.sin(thirty), 0.0],
+        ])
         centers = ang_to_quat(wcenters)
 
         windx = 0
@@ -674,15 +951,14 @@ def sim_telescope_detectors(hw, tele, tube_slots=None):
             location = tubeprops["location"]
 
             wradius = 0.5 * (waferspace * platescale * np.pi / 180.0)
-            wcenters = [
-                np.array([np.tan(thirty) * wradius, wradius, thirty*4]),
-                np.array([-wradius / np.cos(thirty), 0.0, thirty*8]),
-                np.array([np.tan(thirty) * wradius, -wradius, 0.0])
-            ]
-            qwcenters = ang_to_quat(wcenters)
-            centers = list()
-            for qwc in qwcenters:
-                centers.append(qa.mult(tcenters[location], qwc))
+            wcenters = np.array([
+                [np.tan(thirty) * wradius, wradius, thirty*4],
+                [-wradius / np.cos(thirty), 0.0, thirty*8],
+                [np.tan(thirty) * wradius, -wradius, 0.0],
+            ])
+            centers = _quat_mul_batch(
+                tcenters[location], ang_to_quat(wcenters)
+            )
 
             windx = 0
             for wafer_slot in tubeprops["wafer_slots"]:
@@ -694,6 +970,32 @@ def sim_telescope_detectors(hw, tele, tube_slots=None):
     return alldets
 
 
+# Example band properties:  name, center, low, high, NET, A, C and NET_corr.
+# All bands use the same fknee, fmin and alpha.
+_BAND_TABLE = (
+    ("PC_specchip", 38.9, 30.9, 46.9, 281.5, 0.16, 0.79, 1.02),
+    ("PC_eorspec", 92.0, 79.0, 105.0, 361.0, 0.16, 0.80, 1.09),
+    ("PC_eor350", 92.0, 79.0, 105.0, 361.0, 0.16, 0.80, 1.09),
+    ("PC_eor250", 92.0, 79.0, 105.0, 361.0, 0.16, 0.80, 1.09),
+    ("PC_f850", 147.5, 130.0, 165.0, 352.4, 0.17, 0.78, 1.01),
+    ("PC_f350", 225.7, 196.7, 254.7, 724.4, 0.29, 0.62, 1.02),
+    ("PC_f280", 285.4, 258.4, 312.4, 1803.9, 0.36, 0.53, 1.00),
+)
+
+# Example wafer types:  type, count (number of tubes times the number of
+# wafers per tube), number of feedhorns or lenslets, feedhorn or lenslet
+# spacing in mm, spacing in rhombus gaps in mm and bands.  Tube definitions
+# are carry overs from multichroic SO arrays, but might be used in future for
+# EoR-spec 2 band tube.
+_WAFER_TABLE = (
+    ("PC_specchipT", 1*3, 867, 3.84, 0.71, ("PC_specchip",)),
+    ("PC_eorspecT", 1*3, 1728, 2.75, 0.71, ("PC_eorspec",)),
+    ("PC_f850T", 1*3, 3468, 1.97, 0.71, ("PC_f850",)),
+    ("PC_f350T", 1*3, 1728, 2.75, 0.71, ("PC_f350",)),
+    ("PC_f280T", 1*3, 1728, 2.75, 0.71, ("PC_f280",)),
+)
+
+
 def get_example():
     """Return an example Hardware config with the required sections.
 
@@ -706,169 +1008,40 @@ def get_example():
         (Hardware): Hardware object with example parameters.
 
     """
-    cnf = OrderedDict()
-
-    bands = OrderedDict()
-
-
-    bnd = OrderedDict()
-    bnd["center"] = 38.9
-    bnd["low"] = 30.9
-    bnd["high"] = 46.9
-    bnd["bandpass"] = ""
-    bnd["NET"] = 281.5
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.16
-    bnd["C"] = 0.79
-    bnd["NET_corr"] = 1.02
-    bands["PC_specchip"] = bnd
-
-    bnd = OrderedDict()
-    bnd["center"] = 92.0
-    bnd["low"] = 79.0
-    bnd["high"] = 105.0
-    bnd["bandpass"] = ""
-    bnd["NET"] = 361.0
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.16
-    bnd["C"] = 0.80
-    bnd["NET_corr"] = 1.09
-    bands["PC_eorspec"] = bnd
-
-    bnd = OrderedDict()
-    bnd["center"] = 92.0
-    bnd["low"] = 79.0
-    bnd["high"] = 105.0
-    bnd["bandpass"] = ""
-    bnd["NET"] = 361.0
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.16
-    bnd["C"] = 0.80
-    bnd["NET_corr"] = 1.09
-    bands["PC_eor350"] = bnd
-    
-    bnd = OrderedDict()
-    bnd["center"] = 92.0
-    bnd["low"] = 79.0
-    bnd["high"] = 105.0
-    bnd["bandpass"] = ""
-    bnd["NET"] = 361.0
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.16
-    bnd["C"] = 0.80
-    bnd["NET_corr"] = 1.09
-    bands["PC_eor250"] = bnd
-
-    bnd = OrderedDict()
-    bnd["center"] = 147.5
-    bnd["low"] = 130.0
-    bnd["high"] = 165.0
-    bnd["bandpass"] = ""
-    bnd["NET"] = 352.4
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.17
-    bnd["C"] = 0.78
-    bnd["NET_corr"] = 1.01
-    bands["PC_f850"] = bnd
-
-    bnd = OrderedDict()
-    bnd["center"] = 225.7
-    bnd["low"] = 196.7
-    bnd["high"] = 254.7
-    bnd["bandpass"] = ""
-    bnd["NET"] = 724.4
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.29
-    bnd["C"] = 0.62
-    bnd["NET_corr"] = 1.02
-    bands["PC_f350"] = bnd
-
-    bnd = OrderedDict()
-    bnd["center"] = 285.4
-    bnd["low"] = 258.4
-    bnd["high"] = 312.4
-    bnd["bandpass"] = ""
-    bnd["NET"] = 1803.9
-    bnd["fknee"] = 50.0
-    bnd["fmin"] = 0.01
-    bnd["alpha"] = 3.5
-    bnd["A"] = 0.36
-    bnd["C"] = 0.53
-    bnd["NET_corr"] = 1.00
-    bands["PC_f280"] = bnd
-    
-  
+    cnf = dict()
+
+    bands = dict()
+    for name, center, low, high, net, A, C, net_corr in _BAND_TABLE:
+        bnd = dict()
+        bnd["center"] = center
+        bnd["low"] = low
+        bnd["high"] = high
+        bnd["bandpass"] = ""
+        bnd["NET"] = net
+        bnd["fknee"] = 50.0
+        bnd["fmin"] = 0.01
+        bnd["alpha"] = 3.5
+        bnd["A"] = A
+        bnd["C"] = C
+        bnd["NET_corr"] = net_corr
+        bands[name] = bnd
 
     cnf["bands"] = bands
 
-    wafer_slots = OrderedDict()
+    wafer_slots = dict()
 
-    wtypes = ["PC_specchipT", "PC_eorspecT", "PC_f850T", "PC_f350T", "PC_f280T"]
-   # Number of tubes precedes number of wafers per tube'''
-    wcnt = {
-        "PC_specchipT": 1*3,
-        "PC_eorspecT": 1*3,
-        "PC_f850T": 1*3,
-        "PC_f350T": 1*3,
-        "PC_f280T": 1*3,
-    }
-   # Number of feedhorns or lenslets'''
-    wnp = {
-        "PC_specchipT": 867,
-        "PC_eorspecT": 1728,
-        "PC_f850T": 3468,
-        "PC_f350T": 1728,
-        "PC_f280T": 1728,
-    }
-   # Feedhorn or lenslet spacing in mm'''
-    wpixmm = {
-        "PC_specchipT": 3.84,
-        "PC_eorspecT": 2.75,
-        "PC_f850T": 1.97,
-        "PC_f350T": 2.75,
-        "PC_f280T": 2.75,
-    }
-   # Spacing in rhombus gaps in mm'''
-    wrhombgap = {
-        "PC_specchipT": 0.71,
-        "PC_eorspecT": 0.71,
-        "PC_f850T": 0.71,
-        "PC_f350T": 0.71,
-        "PC_f280T": 0.71,
-    }
-   # Tube definitions are carry overs from multichroic SO arrays, but might be used in future for EoR-spec 2 band tube'''
-    wbd = {
-        "PC_specchipT": ["PC_specchip"],
-        "PC_eorspecT": ["PC_eorspec"],
-        "PC_f850T": ["PC_f850"],
-        "PC_f350T": ["PC_f350"],
-        "PC_f280T": ["PC_f280"],
-    #    "LAT_MF": ["LAT_f090", "LAT_f150"], '''
-    }
     windx = 0
     cardindx = 0
-    for wt in wtypes:
-        for ct in range(wcnt[wt]):
+    for wt, wcnt, wnp, wpixmm, wrhombgap, wbd in _WAFER_TABLE:
+        for ct in range(wcnt):
             wn = "w{:02d}".format(windx)
-            wf = OrderedDict()
+            wf = dict()
             wf["type"] = wt
             wf["packing"] = "F"
-            wf["rhombusgap"] = wrhombgap[wt]
-            wf["npixel"] = wnp[wt]
-            wf["pixsize"] = wpixmm[wt]
-            wf["bands"] = wbd[wt]
+            wf["rhombusgap"] = wrhombgap
+            wf["npixel"] = wnp
+            wf["pixsize"] = wpixmm
+            wf["bands"] = list(wbd)
             wf["card_slot"] = "card_slot{:02d}".format(cardindx)
             wf["wafer_name"] = ""
             cardindx += 1
@@ -877,15 +1050,12 @@ def get_example():
 
     cnf["wafer_slots"] = wafer_slots
 
-    tube_slots = OrderedDict()
+    tube_slots = dict()
 
-    woff = {
-        "PC_specchipT": 0,
-        "PC_eorspecT": 0,
-        "PC_f850T": 0,
-        "PC_f350T": 0,
-        "PC_f280T": 0,
-    }
+    # Group the wafer slots by type once, in order.
+    wafers_by_type = dict()
+    for w, props in cnf["wafer_slots"].items():
+        wafers_by_type.setdefault(props["type"], list()).append(w)
 
     ltubes = ["PC_f850T", "PC_f350T", "PC_f280T", "PC_eorspecT", "PC_specchipT"]
     ltubepos = [0, 1, 2, 4, 5]
@@ -893,19 +1063,13 @@ def get_example():
     for tindx in range(5):
         nm = ltube_cryonames[tindx]
         ttyp = ltubes[tindx]
-        tb = OrderedDict()
+        tb = dict()
         tb["type"] = ttyp
         tb["waferspace"] = 128.4
-        tb["wafer_slots"] = list()
-        for tw in range(3):
-            off = 0
-            for w, props in cnf["wafer_slots"].items():
-                if props["type"] == ttyp:
-                    if off == woff[ttyp]:
-                        tb["wafer_slots"].append(w)
-                        woff[ttyp] += 1
-                        break
-                    off += 1
+        # Each tube takes the next (up to) 3 wafers of its type.
+        twafers = wafers_by_type.get(ttyp, list())
+        tb["wafer_slots"] = twafers[:3]
+        del twafers[:3]
         tb["location"] = ltubepos[tindx]
         tb["tube_name"] = ""
         tb["receiver_name"] = ""
@@ -914,15 +1078,15 @@ def get_example():
 
     cnf["tube_slots"] = tube_slots
 
-    telescopes = OrderedDict()
+    telescopes = dict()
 
-    tele = OrderedDict()
+    tele = dict()
     tele["tube_slots"] = ["c1", "i5", "i6", "i2", "i3"]
     tele["platescale"] = 0.00495
     # This tube spacing in mm corresponds to 1.78 degrees projected on
     # the sky at a plate scale of 0.00495 deg/mm.
     tele["tubespace"] = 359.6
-    fwhm = OrderedDict()
+    fwhm = dict()
     fwhm["PC_specchip"] = 0.78
     fwhm["PC_eorspec"] = 0.78
     fwhm["PC_f850"] = 0.25
@@ -936,45 +1100,56 @@ def get_example():
 
     cnf["telescopes"] = telescopes
 
-    card_slots = OrderedDict()
-    crate_slots = OrderedDict()
+    card_slots = dict()
+    crate_slots = dict()
 
     crt_indx = 0
 
-    for tel in cnf["telescopes"]:
-        crn = "crate_slot{:02d}".format(crt_indx)
-        crt = OrderedDict()
-        crt["card_slots"] = list()
-        crt["telescope"] = tel
-        crt["crate_name"] = ""
+    telescopes_d = cnf["telescopes"]
+    tube_slots_d = cnf["tube_slots"]
+    wafer_slots_d = cnf["wafer_slots"]
+
+    # Every card has the same properties
+    card_template = {
+        "nbias": 12,
+        "nAMC": 2,
+        "nchannel": 1764,
+        "card_name": "",
+    }
+
+    def new_crate(tel):
+        return {"card_slots": list(), "telescope": tel, "crate_name": ""}
+
+    for tel, teleprops in telescopes_d.items():
+        crn = f"crate_slot{crt_indx:02d}"
+        crt = new_crate(tel)
 
         ## get all the wafer card numbers for a telescope
-        tb_wfrs = [cnf["tube_slots"][t]["wafer_slots"] for t in cnf["telescopes"][tel]["tube_slots"]]
-        tl_wfrs = [i for sl in tb_wfrs for i in sl]
-        wafer_cards = [cnf["wafer_slots"][w]["card_slot"] for w in tl_wfrs]
+        wafer_cards = [
+            wafer_slots_d[w]["card_slot"]
+            for t in teleprops["tube_slots"]
+            for w in tube_slots_d[t]["wafer_slots"]
+        ]
 
-        # add all cards to the card table and assign to crates
-        for crd in wafer_cards:
-            cdprops = OrderedDict()
-            cdprops["nbias"] = 12
-            cdprops["nAMC"] = 2
-            cdprops["nchannel"] = 1764
-            cdprops["card_name"] = ""
-            card_slots[crd] = cdprops
+        # SAT crates hold 4 cards, the others 6
+        cap = 4 if 'S' in tel else 6
+        first = 0
 
-            crt["card_slots"].append(crd)
+        # add all cards to the card table and assign to crates
+        for ncard, crd in enumerate(wafer_cards, 1):
+            card_slots[crd] = dict(card_template)
 
             # name new crates when current one is full
-            if ('S' in tel and len(crt["card_slots"]) >=4) or len(crt["card_slots"]) >=6:
+            if ncard - first >= cap:
+                crt["card_slots"] = wafer_cards[first:ncard]
+                first = ncard
                 crate_slots[crn] = crt
                 crt_indx += 1
-                crn = "crate_slot{:02d}".format(crt_indx)
-                crt = OrderedDict()
-                crt["card_slots"] = list()
-                crt["telescope"] = tel
-                crt["crate_name"] = ""
+                crn = f"crate_slot{crt_indx:02d}"
+                crt = new_crate(tel)
 
         # each telescope starts with a new crate
+        crt["card_slots"] = wafer_cards[first:]
         crate_slots[crn] = crt
         crt_indx += 1
 
@@ -985,29 +1160,30 @@ def get_example():
     hand = ["L", "R"]
     bandarr=["SAT_f030","SAT_f040"]
 
-    dets = OrderedDict()
-    for d in range(4):
-        dprops = OrderedDict()
-        dprops["wafer_slot"] = "w42"
-        dprops["ID"] = d
-        dprops["pixel"] = "000"
-        bindx = d % 2
-        dprops["band"] = bandarr[bindx]
-        dprops["fwhm"] = 1.0
-        dprops["pol"] = pl[bindx]
-        dprops["handed"] = hand[bindx]
-        dprops["card_slot"] = "card_slot42"
-        dprops["channel"] = d
-        dprops["AMC"] = 0
-        dprops["bias"] = 0
-        dprops["readout_freq_GHz"] = 4.
-        dprops["bondpad"] = 0
-        dprops["mux_position"] = 0
-        dprops["quat"] = np.array([0.0, 0.0, 0.0, 1.0])
-        dprops["detector_name"] = ""
-        dname = "w{}_p{}_{}_{}".format("42", "000", dprops["band"],
-                                     dprops["pol"])
-        dets[dname] = dprops
+    # A few example detectors, built as a table of properties.
+    ndet = 4
+    bindx = np.arange(ndet) % 2
+    table = dict()
+    table["name"] = [
+        f"w42_p000_{bandarr[b]}_{pl[b]}" for b in bindx
+    ]
+    table["wafer_slot"] = ["w42"] * ndet
+    table["ID"] = np.arange(ndet)
+    table["pixel"] = ["000"] * ndet
+    table["band"] = np.asarray(bandarr)[bindx].tolist()
+    table["fwhm"] = np.full(ndet, 1.0)
+    table["pol"] = np.asarray(pl)[bindx].tolist()
+    table["handed"] = np.asarray(hand)[bindx].tolist()
+    table["card_slot"] = ["card_slot42"] * ndet
+    table["channel"] = np.arange(ndet)
+    table["AMC"] = np.zeros(ndet, dtype=np.int64)
+    table["bias"] = np.zeros(ndet, dtype=np.int64)
+    table["readout_freq_GHz"] = np.full(ndet, 4.)
+    table["bondpad"] = np.zeros(ndet, dtype=np.int64)
+    table["mux_position"] = np.zeros(ndet, dtype=np.int64)
+    table["quat"] = [_IDENT_QUAT] * ndet
+    table["detector_name"] = [""] * ndet
+    dets = _table_to_dets(table)
 
     cnf["detectors"] = dets
 
@@ -139,8 +139,20 @@ class OpCadenceMap(toast.Operator):
             else:
                 fname = os.path.join(self.outdir, outprefix + "cadence.h5")
                 with h5py.File(fname, "w") as f:
-                    dset = f.create_dataset("cadence", data=all_hit)
-                    dset.attrs["MJDSTART"] = MJD_start
-                    dset.attrs["MJDSTOP"] = MJD_stop
-                    dset.attrs["NESTED"] = self.nest
+                    # The hit map is mostly empty, so store it in
+                    # compressed chunks.  gzip is readable by any HDF5.
+                    dset = f.create_dataset(
+                        "cadence",
+                        data=all_hit,
+                        chunks=True,
+                        compression="gzip",
+                        compression_opts=1,
+                    )
+                    dset.attrs.update(
+                        {
+                            "MJDSTART": MJD_start,
+                            "MJDSTOP": MJD_stop,
+                            "NESTED": self.nest,
+                        }
+                    )
             print(f"Wrote cadence map to {fname}.", flush=True)
@@ -72,7 +72,9 @@ class OpDemod(toast.Operator):
     def _get_fmax(self, tod):
         times = tod.local_times()
         hwp_angle = np.unwrap(tod.local_hwp_angle())
-        hwp_rate = np.mean(np.diff(hwp_angle) / np.diff(times)) / (2 * np.pi)
+        # Average rotation rate over the span, without per-sample differences
+        hwp_rate = (hwp_angle[-1] - hwp_angle[0]) / (times[-1] - times[0])
+        hwp_rate /= 2 * np.pi
         if self._fmax is not None:
             fmax = self._fmax
         else:
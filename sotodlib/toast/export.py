@@ -19,9 +19,20 @@ from spt3g import core as core3g
 import toast
 from toast.tod.interval import intervals_to_chunklist
 from toast.tod import spt3g_utils as s3utils
+from toast.utils import Logger, Environment
 
 from .frame_utils import tod_to_frames
 
+# Cache names of the form <prefix>_<detector>
+_CACHE_FLAVOR_RE = re.compile(r"^(.*?)_(.*)")
+
+# The G3 (element, map) types used to export each cache dtype
+_FLAVOR_G3_TYPES = {
+    np.dtype(np.float64): (core3g.G3Timestream, core3g.G3TimestreamMap),
+    np.dtype(np.int32): (core3g.G3VectorInt, core3g.G3MapVectorInt),
+    np.dtype(np.uint8): (so3g.IntervalsInt, so3g.MapIntervalsInt),
+}
+
 
 class ToastExport(toast.Operator):
     """Operator which writes data to a directory tree of frame files.
@@ -151,14 +162,22 @@ class ToastExport(toast.Operator):
             for d in nse_dets:
                 st[d] = list()
                 wts[d] = list()
+            # Bind the lookups used in the detector / key double loop.
+            freqmap = f[kfreq]
+            psdmap = f[kpsd]
+            indxmap = f[kindx]
+            weight = noise.weight
             for k in nse_keys:
-                f[kfreq][k] = core3g.G3VectorDouble(noise.freq(k).tolist())
-                f[kpsd][k] = core3g.G3VectorDouble(noise.psd(k).tolist())
-                f[kindx][k] = int(noise.index(k))
+                freqmap[k] = core3g.G3VectorDouble(
+                    np.ascontiguousarray(noise.freq(k), dtype=np.float64))
+                psdmap[k] = core3g.G3VectorDouble(
+                    np.ascontiguousarray(noise.psd(k), dtype=np.float64))
+                kindex = noise.index(k)
+                indxmap[k] = int(kindex)
                 for d in nse_dets:
-                    wt = noise.weight(d, k)
+                    wt = weight(d, k)
                     if wt != 0:
-                        st[d].append(noise.index(k))
+                        st[d].append(kindex)
                         wts[d].append(wt)
             for d in nse_dets:
                 f[dstr][d] = core3g.G3VectorInt(st[d])
@@ -208,28 +227,21 @@ class ToastExport(toast.Operator):
         flavors = set()
         flavor_type = dict()
         flavor_maptype = dict()
-        pat = re.compile(r"^(.*?)_(.*)")
+        detset = set(detnames)
+        pat = _CACHE_FLAVOR_RE
         for nm in list(tod.cache.keys()):
             mat = pat.match(nm)
             if mat is not None:
                 pref = mat.group(1)
                 md = mat.group(2)
-                if md in detnames:
+                if md in detset:
                     # This cache field has the form <prefix>_<det>
                     if pref not in flavor_type:
                         ref = tod.cache.reference(nm)
-                        if ref.dtype == np.dtype(np.float64):
-                            flavors.add(pref)
-                            flavor_type[pref] = core3g.G3Timestream
-                            flavor_maptype[pref] = core3g.G3TimestreamMap
-                        elif ref.dtype == np.dtype(np.int32):
+                        g3types = _FLAVOR_G3_TYPES.get(ref.dtype)
+                        if g3types is not None:
                             flavors.add(pref)
-                            flavor_type[pref] = core3g.G3VectorInt
-                            flavor_maptype[pref] = core3g.G3MapVectorInt
-                        elif ref.dtype == np.dtype(np.uint8):
-                            flavors.add(pref)
-                            flavor_type[pref] = so3g.IntervalsInt
-                            flavor_maptype[pref] = so3g.MapIntervalsInt
+                            flavor_type[pref], flavor_maptype[pref] = g3types
         # If the main signals and flags are coming from the cache, remove
         # them from consideration here.
         if self._cache_name is not None:
@@ -284,16 +296,21 @@ class ToastExport(toast.Operator):
                 self._frame_sample_offs = frame_sample_offs
 
         if cgroup is not None:
-            file_sample_offs = cgroup.bcast(file_sample_offs, root=0)
-            file_frame_offs = cgroup.bcast(file_frame_offs, root=0)
-            frame_sample_offs = cgroup.bcast(frame_sample_offs, root=0)
+            file_sample_offs, file_frame_offs, frame_sample_offs = cgroup.bcast(
+                (file_sample_offs, file_frame_offs, frame_sample_offs), root=0
+            )
         return frame_sample_offs, file_sample_offs, file_frame_offs
 
     def _export_observation(self, obs, cgroup,
-                            detgroup=None, detectors=None, keep_offsets=False):
+                            detgroup=None, detectors=None, keep_offsets=False,
+                            toddets=None):
         """ Export observation in one or more frame files
         """
 
+        log = Logger.get()
+        # The toast logger has no level query of its own.  Check once whether
+        # debug messages are shown, so they are only formatted when needed.
+        log_debug = Environment.get().log_level() in ("DEBUG", "VERBOSE")
         grouprank = 0
         if cgroup is not None:
             grouprank = cgroup.rank
@@ -324,7 +341,8 @@ class ToastExport(toast.Operator):
             detquat = {}
             detindx = {}
             detnames = []
-            toddets = set(tod.detectors)
+            if toddets is None:
+                toddets = set(tod.detectors)
             for det in detectors:
                 if det not in toddets:
                     continue
@@ -399,8 +417,9 @@ class ToastExport(toast.Operator):
                     obsdir, ifile, detgroup), flush=True)
                 print("    start frame = {}, nframes = {}"
                       .format(foff, nframes), flush=True)
-                print("    frame offs = ", frm_offsets, flush=True)
-                print("    frame sizes = ", frm_sizes, flush=True)
+                if log_debug:
+                    log.debug("{} frame offsets = {}, frame sizes = {}".format(
+                        ffile, frm_offsets, frm_sizes))
 
             fdata = tod_to_frames(
                 tod, foff, nframes, frm_offsets, frm_sizes,
@@ -417,8 +436,10 @@ class ToastExport(toast.Operator):
             )
 
             if grouprank == 0:
-                for fdt in fdata:
-                    writer(fdt)
+                # Release each frame as soon as it is written.
+                for ifrm in range(len(fdata)):
+                    writer(fdata[ifrm])
+                    fdata[ifrm] = None
                 del writer
             del fdata
 
@@ -464,9 +485,11 @@ class ToastExport(toast.Operator):
                 self._export_observation(obs, cgroup)
             else:
                 keep_offsets = False
+                # The detector groups are all matched against the same TOD
+                toddets = set(obs["tod"].detectors)
                 for detgroup, detectors in self._detgroups.items():
                     self._export_observation(obs, cgroup, detgroup, detectors,
-                                             keep_offsets)
+                                             keep_offsets, toddets)
                     keep_offsets = True
 
         return
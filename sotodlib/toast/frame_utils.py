@@ -5,6 +5,7 @@
 import sys
 import re
 
+import functools
 import itertools
 import operator
 
@@ -37,6 +38,18 @@ FIELD_TO_CACHE = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def _mpi_type(dtype):
+    """Return the MPI datatype for a cache field dtype, or None."""
+    mpi_types = {
+        np.dtype(np.float64): MPI.DOUBLE,
+        np.dtype(np.int64): MPI.INT64_T,
+        np.dtype(np.int32): MPI.INT32_T,
+        np.dtype(np.uint8): MPI.UINT8_T,
+    }
+    return mpi_types.get(np.dtype(dtype))
+
+
 def recode_timestream(ts, params, rmstarget=2 ** 10, rmsmode="white"):
     """ts is a G3Timestream.  Returns a new
     G3Timestream for same samples as ts, but with data
@@ -88,7 +101,7 @@ def recode_timestream(ts, params, rmstarget=2 ** 10, rmsmode="white"):
         offset = 0.5 * (vmin + vmax)
         amp = vmax - offset
     else:
-        amp = np.max(np.abs(vmin - offset), np.abs(vmax - offset))
+        amp = max(np.abs(vmin - offset), np.abs(vmax - offset))
     if gain is None:
         if rmsmode == "white":
             rms = np.std(np.diff(v)) / np.sqrt(2)
@@ -106,7 +119,10 @@ def recode_timestream(ts, params, rmstarget=2 ** 10, rmsmode="white"):
             gain *= 0.5
     elif amp * gain >= 2 ** 23:
         raise RuntimeError("The specified gain and offset saturate the band.")
-    v = np.round((v - offset) * gain)
+    # v is already our own copy, so rescale it in place
+    v -= offset
+    v *= gain
+    np.round(v, out=v)
     new_ts = core3g.G3Timestream(v)
     new_ts.units = core3g.G3TimestreamUnits.Counts
     new_ts.SetFLACCompression(True)
@@ -468,20 +484,17 @@ def tod_to_frames(
             if (len(ref.shape) > 1) and (ref.shape[1] > 0):
                 nnz = ref.shape[1]
             if comm is not None:
-                if ref.dtype == np.dtype(np.float64):
-                    mtype = MPI.DOUBLE
-                elif ref.dtype == np.dtype(np.int64):
-                    mtype = MPI.INT64_T
-                elif ref.dtype == np.dtype(np.int32):
-                    mtype = MPI.INT32_T
-                elif ref.dtype == np.dtype(np.uint8):
-                    mtype = MPI.UINT8_T
-                else:
+                mtype = _mpi_type(ref.dtype)
+                if mtype is None:
                     msg = "Cannot use cache field {} of type {}"\
                         .format(field, ref.dtype)
                     raise RuntimeError(msg)
             if cacheoff is not None:
-                pdata = ref.flatten()[nnz * cacheoff : nnz * (cacheoff + ncache)]
+                # Copy only the requested slice.  The copy is needed since
+                # callers apply flag masks in place.
+                pdata = ref.reshape(-1)[
+                    nnz * cacheoff : nnz * (cacheoff + ncache)
+                ].copy()
             else:
                 pdata = np.zeros(0, dtype=ref.dtype)
         return (pdata, nnz, mtype)
@@ -508,9 +521,11 @@ def tod_to_frames(
         if rankdet == prow:
             psizes = None
             if comm_row is None:
-                psizes = [pz]
+                psizes = np.array([pz], dtype=np.int64)
             else:
-                psizes = comm_row.gather(pz, root=0)
+                if ranksamp == 0:
+                    psizes = np.zeros(comm_row.size, dtype=np.int64)
+                comm_row.Gather(np.array([pz], dtype=np.int64), psizes, root=0)
             disp = None
             totsize = None
             if ranksamp == 0:
@@ -518,16 +533,14 @@ def tod_to_frames(
                 allnnz = nnz
                 gproc = rank
                 # Compute the displacements into the receive buffer.
-                disp = [0]
-                for ps in psizes[:-1]:
-                    last = disp[-1]
-                    disp.append(last + ps)
+                disp = np.zeros_like(psizes)
+                np.cumsum(psizes[:-1], out=disp[1:])
                 totsize = np.sum(psizes)
                 # allocate receive buffer
                 gdata = np.zeros(totsize, dtype=pdata.dtype)
 
             if comm_row is None:
-                pdata[:] = gdata
+                gdata[:] = pdata
             else:
                 comm_row.Gatherv(pdata, [gdata, psizes, disp, mpitype], root=0)
             del disp
@@ -573,11 +586,12 @@ def tod_to_frames(
     # For efficiency, we are going to gather the data for all frames at once.
     # Then we will split those up when doing the write.
 
-    # Frame offsets relative to the memory buffers we are gathering
-    fdataoff = [0]
-    for f in frame_sizes[:-1]:
-        last = fdataoff[-1]
-        fdataoff.append(last + f)
+    # Frame offsets relative to the memory buffers we are gathering, as
+    # arrays of the first and last buffer sample of each frame
+    fdatalast = np.cumsum(frame_sizes, dtype=np.int64) - 1
+    fdatafirst = np.zeros_like(fdatalast)
+    fdatafirst[1:] = fdatalast[:-1] + 1
+    fdataoff = fdatafirst.tolist()
 
     # The list of frames- only on the root process.
     fdata = None
@@ -596,18 +610,18 @@ def tod_to_frames(
         if g3t == core3g.G3VectorTime:
             # Special case for time values stored as int64_t, but
             # wrapped in a class.
+            # Convert all frames in one pass and construct each vector
+            # directly from its slice.
+            g3ticks = np.ascontiguousarray(data, dtype=np.int64)
             for f in range(n_frames):
                 dataoff = fdataoff[f]
                 ndata = frame_sizes[f]
-                g3times = list()
-                for t in range(ndata):
-                    g3times.append(core3g.G3Time(data[dataoff + t]))
+                g3times = core3g.G3VectorTime(
+                    g3ticks[dataoff : dataoff + ndata])
                 if mapfield is None:
-                    fdata[f][framefield] = core3g.G3VectorTime(g3times)
+                    fdata[f][framefield] = g3times
                 else:
-                    fdata[f][framefield][mapfield] = \
-                        core3g.G3VectorTime(g3times)
-                del g3times
+                    fdata[f][framefield][mapfield] = g3times
         elif g3t == so3g.IntervalsInt:
             # Flag vector is written as a simple boolean.
             for f in range(n_frames):
@@ -626,49 +640,48 @@ def tod_to_frames(
                 raise RuntimeError(
                     "You must provide the time stamp vector with a "
                     "Timestream object")
+            gain_field = "compressor_gain_" + framefield
+            offset_field = "compressor_offset_" + framefield
+            # Gather the time range of all frames at once
+            tstarts = (times[cacheoff + fdatafirst] * 1e8).tolist()
+            tstops = (times[cacheoff + fdatalast] * 1e8).tolist()
             for f in range(n_frames):
+                frame = fdata[f]
                 dataoff = fdataoff[f]
                 ndata = frame_sizes[f]
-                timeslice = times[cacheoff + dataoff : cacheoff + dataoff + ndata]
-                tstart = timeslice[0] * 1e8
-                tstop = timeslice[-1] * 1e8
-                if mapfield is None:
-                    if g3units is None:
-                        fdata[f][framefield] = \
-                            g3t(data[dataoff : dataoff + ndata])
-                    else:
-                        fdata[f][framefield] = \
-                            g3t(data[dataoff : dataoff + ndata], g3units)
-                    fdata[f][framefield].start = core3g.G3Time(tstart)
-                    fdata[f][framefield].stop = core3g.G3Time(tstop)
+                dslice = data[dataoff : dataoff + ndata]
+                if g3units is None:
+                    tstream = g3t(dslice)
                 else:
+                    tstream = g3t(dslice, g3units)
+                if mapfield is not None:
                     # Individual detector data.  The only fields that
                     # we (optionally) compress.
-                    if g3units is None:
-                        tstream = g3t(data[dataoff : dataoff + ndata])
-                    else:
-                        tstream = g3t(data[dataoff : dataoff + ndata], g3units)
-                    if compress and "compressor_gain_" + framefield in fdata[f]:
+                    if compress and gain_field in frame:
                         (tstream, gain, offset) = recode_timestream(tstream, compress)
-                        fdata[f]["compressor_gain_" + framefield][mapfield] = gain
-                        fdata[f]["compressor_offset_" + framefield][mapfield] = offset
-                    fdata[f][framefield][mapfield] = tstream
-                    fdata[f][framefield][mapfield].start = core3g.G3Time(tstart)
-                    fdata[f][framefield][mapfield].stop = core3g.G3Time(tstop)
+                        frame[gain_field][mapfield] = gain
+                        frame[offset_field][mapfield] = offset
+                # Set the time range before storing the timestream, rather
+                # than looking it up again in the frame.
+                tstream.start = core3g.G3Time(tstarts[f])
+                tstream.stop = core3g.G3Time(tstops[f])
+                if mapfield is None:
+                    frame[framefield] = tstream
+                else:
+                    frame[framefield][mapfield] = tstream
         else:
-            # The bindings of G3Vector seem to only work with
-            # lists.  This is probably horribly inefficient.
+            # The G3Vector bindings take contiguous arrays of the common
+            # numeric types directly.  Other types still go through a list.
             for f in range(n_frames):
                 dataoff = fdataoff[f]
                 ndata = frame_sizes[f]
-                if len(data.shape) == 1:
-                    fdata[f][framefield] = \
-                        g3t(data[dataoff : dataoff + ndata].tolist())
-                else:
-                    # We have a 2D quantity
-                    fdata[f][framefield] = \
-                        g3t(data[dataoff : dataoff + ndata, :].flatten()
-                            .tolist())
+                # 2D quantities are stored flattened
+                fslice = np.ascontiguousarray(
+                    data[dataoff : dataoff + ndata]).reshape(-1)
+                try:
+                    fdata[f][framefield] = g3t(fslice)
+                except TypeError:
+                    fdata[f][framefield] = g3t(fslice.tolist())
         return
 
     # Compute the overlap of all frames with the local process.  We want to
@@ -704,7 +717,7 @@ def tod_to_frames(
 
     bore = None
     if rankdet == 0:
-        bore = tod.read_boresight(local_start=cacheoff, n=ncache).flatten()
+        bore = np.ravel(tod.read_boresight(local_start=cacheoff, n=ncache))
     if comm is not None:
         bore = gather_field(0, bore, 4, MPI.DOUBLE, cacheoff, ncache, 0)
     if rank == 0:
@@ -713,8 +726,8 @@ def tod_to_frames(
 
     bore = None
     if rankdet == 0:
-        bore = tod.read_boresight_azel(
-            local_start=cacheoff, n=ncache).flatten()
+        bore = np.ravel(tod.read_boresight_azel(
+            local_start=cacheoff, n=ncache))
     if comm is not None:
         bore = gather_field(0, bore, 4, MPI.DOUBLE, cacheoff, ncache, 1)
     if rank == 0:
@@ -738,9 +751,9 @@ def tod_to_frames(
             fdata[f]["boresight"] = core3g.G3TimestreamMap()
         ang_theta, ang_phi, ang_psi = qa.to_angles(bore)
         # Astronomical convention for azimuth is opposite to spherical
-        # coordinate phi.
-        ang_az = -ang_phi
-        ang_el = (np.pi / 2.0) - ang_theta
+        # coordinate phi.  Convert in place to avoid temporaries.
+        ang_az = np.negative(ang_phi, out=ang_phi)
+        ang_el = np.subtract(np.pi / 2.0, ang_theta, out=ang_theta)
         ang_roll = ang_psi
         split_field(ang_az, core3g.G3Timestream, "boresight", "az", None,
                     times=times)
@@ -761,7 +774,7 @@ def tod_to_frames(
 
     pos = None
     if rankdet == 0:
-        pos = tod.read_position(local_start=cacheoff, n=ncache).flatten()
+        pos = np.ravel(tod.read_position(local_start=cacheoff, n=ncache))
     if comm is not None:
         pos = gather_field(0, pos, 3, MPI.DOUBLE, cacheoff, ncache, 2)
     if rank == 0:
@@ -769,7 +782,7 @@ def tod_to_frames(
 
     vel = None
     if rankdet == 0:
-        vel = tod.read_velocity(local_start=cacheoff, n=ncache).flatten()
+        vel = np.ravel(tod.read_velocity(local_start=cacheoff, n=ncache))
     if comm is not None:
         vel = gather_field(0, vel, 3, MPI.DOUBLE, cacheoff, ncache, 3)
     if rank == 0:
@@ -826,13 +839,13 @@ def tod_to_frames(
                         fdata[f]["compressor_gain_" + fnm] = core3g.G3MapDouble()
                         fdata[f]["compressor_offset_" + fnm] = core3g.G3MapDouble()
 
+    # Local detector names as an array, for matching them all at once
+    local_dets = np.array(list(tod.local_dets), dtype=str)
+
     for dindx, dname in enumerate(detnames):
         drow = -1
         # Demodulation may have synthesized new detector names
-        dnames = []
-        for x in tod.local_dets:
-            if x.endswith(dname):
-                dnames.append(x)
+        dnames = local_dets[np.char.endswith(local_dets, dname)].tolist()
         if dnames:
             drow = rankdet
 
@@ -859,7 +872,9 @@ def tod_to_frames(
         if comm is not None:
             prow = comm.bcast(prow, root=0)
             all_dnames = comm.allgather(dnames)
-            dnames = list(set(np.concatenate(all_dnames).flat))
+            # Every process must gather the detectors in the same order, so
+            # do not rely on the (per-process) set iteration order.
+            dnames = sorted(set(itertools.chain.from_iterable(all_dnames)))
 
         # "signal"
 
@@ -889,8 +904,11 @@ def tod_to_frames(
             nnz = 1
             if cache_flags is None:
                 if rankdet == prow:
-                    detdata = tod.local_flags(dname)[cacheoff : cacheoff + ncache]
-                    detdata &= mask_flag
+                    # Mask into a new array, not the TOD flags themselves
+                    detdata = (
+                        tod.local_flags(dname)[cacheoff : cacheoff + ncache]
+                        & mask_flag
+                    )
             else:
                 cache_det = "{}_{}".format(cache_flags, dname)
                 detdata, nnz, mtype = get_local_cache(prow, cache_det, cacheoff,
@@ -6,10 +6,8 @@ This module contains code for interfacing with TOAST data representations.
 
 """
 import os
-import sys
 import re
 
-import traceback
 
 import numpy as np
 
@@ -34,6 +32,10 @@ from ..core import Hardware
 
 from .frame_utils import frame_to_tod
 
+# Frame files are named <prefix>_<8 digit sample offset>.g3.  This is the
+# pattern used when no prefix is given.
+_FRAME_FILE_RE = re.compile(r".*_(\d{8}).g3")
+
 
 # FIXME:  This CamelCase name is ridiculous in all caps...
 
@@ -367,6 +369,8 @@ def parse_cal_frames(calframes, dets):
         detlist = list(sorted(dets.data["detectors"].keys()))
     elif isinstance(dets, list):
         detlist = dets
+    if detlist is not None:
+        detset = set(detlist)
     qname = "detector_offset"
     detoffset = dict()
     kfreq = "noise_stream_freq"
@@ -387,7 +391,7 @@ def parse_cal_frames(calframes, dets):
                 detoffset[d] = np.array(q)
         else:
             for d, q in calframe[qname].iteritems():
-                if d in detlist:
+                if d in detset:
                     detoffset[d] = np.array(q)
         detnames += list(detoffset.keys())
         for k, v in calframe[kfreq].iteritems():
@@ -402,9 +406,7 @@ def parse_cal_frames(calframes, dets):
             detwghts[k] = np.array(v)
     detnames = sorted(detnames)
     for det in detnames:
-        mixing[det] = dict()
-        for st, wt in zip(detstrms[det], detwghts[det]):
-            mixing[det][st] = wt
+        mixing[det] = dict(zip(detstrms[det], detwghts[det]))
     #print(detnames, noise_freq, noise_psds, noise_index, mixing, flush=True)
     # FIXME:  The original data dump should have specified the mixing matrix
     # explicitly.
@@ -414,6 +416,122 @@ def parse_cal_frames(calframes, dets):
     return detoffset, nse
 
 
+def _scan_frame_file(ffile, fsampoff, first_offset):
+    """Read the frame layout of one frame file.
+
+    Args:
+        ffile (str):  The frame file.
+        fsampoff (int):  The sample offset of the first frame in the file.
+        first_offset (int):  The sample offset of the first file in the
+            observation.  Calibration frames are only kept at this offset.
+
+    Returns:
+        (tuple):  The number of frames, the list of frame sizes, the array of
+            frame sample offsets, the list of (offset, size) of the scan
+            frames, the last Observation frame (or None) and the list of
+            Calibration frames at the first sample offset.
+
+    """
+    allframes = 0
+    fsizes = list()
+    foffs = list()
+    scans = list()
+    obsframe = None
+    calframes = list()
+    for frame in core3g.G3File(ffile):
+        allframes += 1
+        if frame.type == core3g.G3FrameType.Scan:
+            # This is a scan frame, process it.
+            fsz = len(frame["boresight"]["az"])
+            scans.append((fsampoff, fsz))
+            foffs.append(fsampoff)
+            fsizes.append(fsz)
+            fsampoff += fsz
+        else:
+            foffs.append(0)
+            fsizes.append(0)
+            if frame.type == core3g.G3FrameType.Observation:
+                obsframe = frame
+            elif frame.type == core3g.G3FrameType.Calibration:
+                if fsampoff == first_offset:
+                    calframes.append(frame)
+            else:
+                # Unknown frame type- skip it.
+                pass
+    return (allframes, fsizes, np.array(foffs, dtype=np.int64), scans,
+            obsframe, calframes)
+
+
+def _scan_frame_files(file_offsets, first_offset, mpicomm):
+    """Read the frame layout of all frame files in an observation.
+
+    Every process reads the frame layout of a subset of the files, and then
+    all processes combine the results in file order.
+
+    Args:
+        file_offsets (list):  The (file, sample offset) of each frame file.
+        first_offset (int):  The sample offset of the first file in the
+            observation.
+        mpicomm (mpi4py.MPI.Comm):  The communicator, or None.
+
+    Returns:
+        (list):  The result of _scan_frame_file() for each file, in the
+            order of file_offsets.
+
+    """
+    rank = 0
+    nproc = 1
+    if mpicomm is not None:
+        rank = mpicomm.rank
+        nproc = mpicomm.size
+    scanned = [
+        (ifile, _scan_frame_file(ffile, fsampoff, first_offset))
+        for ifile, (ffile, fsampoff) in enumerate(file_offsets)
+        if ifile % nproc == rank
+    ]
+    if mpicomm is not None:
+        scanned = [x for plist in mpicomm.allgather(scanned) for x in plist]
+    scanned.sort(key=lambda x: x[0])
+    return [x[1] for x in scanned]
+
+
+def _frame_intervals(frame_sizes_by_offset, times, local_offset, nsample):
+    """Build the intervals of the frames in an observation.
+
+    The time stamps are only known for frames that are entirely in the local
+    sample range.  Other frames get zero start and stop times.
+
+    Args:
+        frame_sizes_by_offset (dict):  The size of each frame, keyed by the
+            global sample offset of the frame.
+        times (array):  The local time stamps.
+        local_offset (int):  The global sample offset of the first local
+            sample.
+        nsample (int):  The number of local samples.
+
+    Returns:
+        (list):  One Interval per frame.
+
+    """
+    nint = len(frame_sizes_by_offset)
+    firsts = np.fromiter(frame_sizes_by_offset.keys(), dtype=np.int64,
+                         count=nint)
+    lasts = firsts - 1 + np.fromiter(frame_sizes_by_offset.values(),
+                                     dtype=np.int64, count=nint)
+    local = (firsts >= local_offset) & (lasts < local_offset + nsample)
+    starts = np.zeros(nint, dtype=np.float64)
+    stops = np.zeros(nint, dtype=np.float64)
+    # The frame offsets are global, the time stamps are local
+    starts[local] = times[firsts[local] - local_offset]
+    stops[local] = times[lasts[local] - local_offset]
+    return [
+        Interval(start=start, stop=stop, first=first, last=last)
+        for start, stop, first, last in zip(
+            starts.tolist(), stops.tolist(), firsts.tolist(), lasts.tolist()
+        )
+    ]
+
+
 def load_observation(path, dets=None, mpicomm=None, prefix=None, **kwargs):
     """Loads an observation into memory.
 
@@ -449,75 +567,52 @@ def load_observation(path, dets=None, mpicomm=None, prefix=None, **kwargs):
 
     latest_obs = None
     latest_cal_frames = []
-    first_offset = None
 
+    # One process finds the frame files and their starting sample offsets.
+    file_offsets = list()
     if rank == 0:
-        pat = None
-        if prefix is None:
-            pat = re.compile(r".*_(\d{8}).g3")
-        else:
+        pat = _FRAME_FILE_RE
+        if prefix is not None:
             pat = re.compile(r"{}_(\d{{8}}).g3".format(prefix))
         for root, dirs, files in os.walk(path, topdown=True):
             for f in sorted(files):
                 fmat = pat.match(f)
                 if fmat is not None:
-                    ffile = os.path.join(path, f)
-                    fsampoff = int(fmat.group(1))
-                    if first_offset is None:
-                        first_offset = fsampoff
-                    file_names.append(ffile)
-                    allframes = 0
-                    file_sample_offs[ffile] = fsampoff
-                    frame_sizes[ffile] = []
-                    frame_sample_offs[ffile] = []
-                    for frame in core3g.G3File(ffile):
-                        allframes += 1
-                        if frame.type == core3g.G3FrameType.Scan:
-                            # This is a scan frame, process it.
-                            fsz = len(frame["boresight"]["az"])
-                            if fsampoff not in frame_sizes_by_offset:
-                                frame_sizes_by_offset[fsampoff] = fsz
-                            else:
-                                if frame_sizes_by_offset[fsampoff] != fsz:
-                                    raise RuntimeError(
-                                        "Frame size at {} changes. {} != {}"
-                                        "".format(
-                                            fsampoff,
-                                            frame_sizes_by_offset[fsampoff],
-                                            fsz))
-                            frame_sample_offs[ffile].append(fsampoff)
-                            frame_sizes[ffile].append(fsz)
-                            fsampoff += fsz
-                        else:
-                            frame_sample_offs[ffile].append(0)
-                            frame_sizes[ffile].append(0)
-                            if frame.type == core3g.G3FrameType.Observation:
-                                latest_obs = frame
-                            elif frame.type == core3g.G3FrameType.Calibration:
-                                if fsampoff == first_offset:
-                                    latest_cal_frames.append(frame)
-                            else:
-                                # Unknown frame type- skip it.
-                                pass
-                    frame_sample_offs[ffile] = np.array(frame_sample_offs[ffile], dtype=np.int64)
-                    nframes[ffile] = allframes
-                    log.debug("{} starts at {} and has {} frames".format(
-                        ffile, file_sample_offs[ffile], nframes[ffile]))
+                    file_offsets.append(
+                        (os.path.join(path, f), int(fmat.group(1)))
+                    )
             break
-        if len(file_names) == 0:
-            raise RuntimeError(
-                "No frames found at '{}' with prefix '{}'"
-                .format(path, prefix))
-
     if mpicomm is not None:
-        latest_obs = mpicomm.bcast(latest_obs, root=0)
-        latest_cal_frames = mpicomm.bcast(latest_cal_frames, root=0)
-        nframes = mpicomm.bcast(nframes, root=0)
-        file_names = mpicomm.bcast(file_names, root=0)
-        file_sample_offs = mpicomm.bcast(file_sample_offs, root=0)
-        frame_sizes = mpicomm.bcast(frame_sizes, root=0)
-        frame_sizes_by_offset = mpicomm.bcast(frame_sizes_by_offset, root=0)
-        frame_sample_offs = mpicomm.bcast(frame_sample_offs, root=0)
+        file_offsets = mpicomm.bcast(file_offsets, root=0)
+    if len(file_offsets) == 0:
+        raise RuntimeError(
+            "No frames found at '{}' with prefix '{}'"
+            .format(path, prefix))
+    first_offset = file_offsets[0][1]
+
+    scanned = _scan_frame_files(file_offsets, first_offset, mpicomm)
+
+    for (ffile, fsampoff), (allframes, fsizes, foffs, scans, obsframe,
+                            calframes) in zip(file_offsets, scanned):
+        file_names.append(ffile)
+        file_sample_offs[ffile] = fsampoff
+        frame_sizes[ffile] = fsizes
+        frame_sample_offs[ffile] = foffs
+        nframes[ffile] = allframes
+        for off, fsz in scans:
+            if off not in frame_sizes_by_offset:
+                frame_sizes_by_offset[off] = fsz
+            else:
+                if frame_sizes_by_offset[off] != fsz:
+                    raise RuntimeError(
+                        "Frame size at {} changes. {} != {}"
+                        "".format(off, frame_sizes_by_offset[off], fsz))
+        if obsframe is not None:
+            latest_obs = obsframe
+        latest_cal_frames.extend(calframes)
+        if rank == 0:
+            log.debug("{} starts at {} and has {} frames".format(
+                ffile, file_sample_offs[ffile], nframes[ffile]))
 
     if latest_obs is None:
         raise RuntimeError("No observation frame was found!")
@@ -536,19 +631,10 @@ def load_observation(path, dets=None, mpicomm=None, prefix=None, **kwargs):
                 mpicomm=mpicomm, **kwargs)
     obs["tod"] = tod
 
-    intervals = []
-    times = tod.local_times()
     local_offset, nsample = tod.local_samples
-    for offset, size in frame_sizes_by_offset.items():
-        if offset >= local_offset and offset + size <= local_offset + nsample:
-            start, stop = times[offset], times[offset + size - 1]
-        else:
-            start, stop = 0, 0
-        intervals.append(
-            Interval(start=start, stop=stop, first=offset, last=offset + size - 1)
-        )
-
-    obs["intervals"] = intervals
+    obs["intervals"] = _frame_intervals(
+        frame_sizes_by_offset, tod.local_times(), local_offset, nsample
+    )
 
     return obs
 
@@ -567,11 +653,9 @@ def obsweight(path, prefix=None):
         (float):  Approximate total size in MB.
 
     """
-    pat = None
-    if prefix is None:
-        pat = re.compile(r".*_\d{8}.g3")
-    else:
-        pat = re.compile(r"{}_\d{{8}}.g3".format(prefix))
+    pat = _FRAME_FILE_RE
+    if prefix is not None:
+        pat = re.compile(r"{}_(\d{{8}}).g3".format(prefix))
     total = 0
     for root, dirs, files in os.walk(path, topdown=True):
         for f in files:
@@ -583,6 +667,40 @@ def obsweight(path, prefix=None):
     return float(total) / 1.0e6
 
 
+def _observation_weights(dir, obs=None, prefix=None):
+    """Find the observations in a directory and their approximate sizes.
+
+    Args:
+        dir (str):  The top-level directory that contains subdirectories (one
+            per observation).
+        obs (list):  Only consider these observations.
+        prefix (str):  Only consider frame files with this prefix.
+
+    Returns:
+        (tuple):  The sorted list of observation names and the list of their
+            weights from obsweight().
+
+    """
+    obslist = list()
+    for root, dirs, files in os.walk(dir, topdown=True):
+        for d in dirs:
+            # FIXME:  Add some check here to make sure that this is a
+            # directory of frame files.
+            obslist.append(d)
+        break
+    obslist = sorted(obslist)
+    # Filter by the requested obs
+    if obs is not None:
+        wanted = set(obs)
+        obslist = [ob for ob in obslist if ob in wanted]
+    # Only the observations we are going to load need a weight, and each
+    # weight comes from that observation's own directory.
+    dweight = [
+        obsweight(os.path.join(dir, x), prefix=prefix) for x in obslist
+    ]
+    return obslist, dweight
+
+
 def load_data(dir, obs=None, comm=None, prefix=None, **kwargs):
     """Loads data into memory.
 
@@ -608,37 +726,23 @@ def load_data(dir, obs=None, comm=None, prefix=None, **kwargs):
     # the communicator within the group
     cgroup = comm.comm_group
 
-    # One process gets the list of observation directories
+    # One process gets the list of observation directories and their
+    # approximate sizes.
     obslist = list()
-    weight = dict()
+    dweight = list()
 
     worldrank = 0
     if cworld is not None:
         worldrank = cworld.rank
 
     if worldrank == 0:
-        for root, dirs, files in os.walk(dir, topdown=True):
-            for d in dirs:
-                # FIXME:  Add some check here to make sure that this is a
-                # directory of frame files.
-                obslist.append(d)
-                weight[d] = obsweight(os.path.join(root, dir), prefix=prefix)
-            break
-        obslist = sorted(obslist)
-        # Filter by the requested obs
-        fobs = list()
-        if obs is not None:
-            for ob in obslist:
-                if ob in obs:
-                    fobs.append(ob)
-            obslist = fobs
+        obslist, dweight = _observation_weights(dir, obs=obs, prefix=prefix)
 
     if cworld is not None:
         obslist = cworld.bcast(obslist, root=0)
-        weight = cworld.bcast(weight, root=0)
+        dweight = cworld.bcast(dweight, root=0)
 
     # Distribute observations based on approximate size
-    dweight = [weight[x] for x in obslist]
     distobs = distribute_discrete(dweight, comm.ngroups)
 
     # Distributed data
@@ -657,10 +761,9 @@ def load_data(dir, obs=None, comm=None, prefix=None, **kwargs):
             data.obs.append(
                 load_observation(opath, mpicomm=cgroup, prefix=prefix, **kwargs)
             )
-        except:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            lines = traceback.format_exception(exc_type, exc_value,
-                                               exc_traceback)
+        except Exception as e:
+            import traceback
+            lines = traceback.format_exception(type(e), e, e.__traceback__)
             lines = ["Proc {}: {}".format(worldrank, x)
                      for x in lines]
             print("".join(lines), flush=True)
@@ -72,12 +72,15 @@ def export_TOD(args, comm, data, totalname, schedules, other=None, verbose=True)
             )
         prefix = "{}_{}".format(args.bands, key)
         det_groups = {}
+        # Observations usually share a focalplane, only group each one once
+        grouped = set()
         for obs in data.obs:
-            for (det_name, det_data) in obs["focalplane"].items():
-                value = det_data[key]
-                if value not in det_groups:
-                    det_groups[value] = []
-                det_groups[value].append(det_name)
+            focalplane = obs["focalplane"]
+            if id(focalplane) in grouped:
+                continue
+            grouped.add(id(focalplane))
+            for (det_name, det_data) in focalplane.items():
+                det_groups.setdefault(det_data[key], []).append(det_name)
     else:
         prefix = args.bands
         det_groups = None
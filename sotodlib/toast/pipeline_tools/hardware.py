@@ -269,18 +269,36 @@ def get_focalplane(args, comm, hw, det_index, verbose=False):
             pass
         if fpradius is None:
             fpradius = 0
+        # Map every wafer slot to its tube slot, and every tube slot to its
+        # telescope, once for all detectors.  The first match wins.
+        wafer_tube = dict()
+        for tube_name, tube_data in hw.data["tube_slots"].items():
+            for wafer_slot in tube_data["wafer_slots"]:
+                wafer_tube.setdefault(wafer_slot, tube_name)
+        tube_telescope = dict()
+        for telescope_name, telescope_data in hw.data["telescopes"].items():
+            for tube_name in telescope_data["tube_slots"]:
+                tube_telescope.setdefault(tube_name, telescope_name)
         for det_name, det_data in hw.data["detectors"].items():
             # RNG index for this detector
             index = det_index[det_name]
             wafer_slot = det_data["wafer_slot"]
             # Determine which tube_slot has this wafer
-            for tube_name, tube_data in hw.data["tube_slots"].items():
-                if wafer_slot in tube_data["wafer_slots"]:
-                    break
+            try:
+                tube_name = wafer_tube[wafer_slot]
+            except KeyError:
+                raise RuntimeError(
+                    "Failed to match wafer_slot = '{}' of detector '{}' with "
+                    "a tube_slot".format(wafer_slot, det_name)
+                )
             # Determine which telescope has this tube slot
-            for telescope_name, telescope_data in hw.data["telescopes"].items():
-                if tube_name in telescope_data["tube_slots"]:
-                    break
+            try:
+                telescope_name = tube_telescope[tube_name]
+            except KeyError:
+                raise RuntimeError(
+                    "Failed to match tube_slot = '{}' with a telescope"
+                    .format(tube_name)
+                )
             fpradius = max(fpradius, FOCALPLANE_RADII_DEG[telescope_name])
             det_params = DetectorParams(
                 det_data,
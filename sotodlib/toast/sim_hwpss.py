@@ -1,6 +1,7 @@
 # Copyright (c) 2020 Simons Observatory.
 # Full license can be found in the top level "LICENSE" file.
 
+import functools
 import os
 import pickle
 import sys
@@ -13,6 +14,74 @@ import toast.qarray as qa
 
 XAXIS, YAXIS, ZAXIS = np.eye(3)
 
+# HWPSS database frequency of each band
+BAND_FREQ = {
+    "SAT_f030" : "027",
+    "SAT_f040" : "039",
+    "SAT_f090" : "093",
+    "SAT_f150" : "145",
+    "SAT_f230" : "225",
+    "SAT_f290" : "278",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_hwpss(fname_hwpss):
+    """Load the HWPSS database once per file.
+
+    The nested profiles are stacked by frequency into one contiguous
+    float32 array of shape (Nfreq, Ntheta, Nchi, Nstokes) per kind, so that
+    the incident angle lookups are plain ndarray indexing.  Single precision
+    is ample for the simulated HWPSS and halves the memory traffic of the
+    per-sample interpolation.  The result is shared by all
+    operator instances reading the same file (e.g. one per Monte Carlo
+    realization).
+
+    """
+    with open(fname_hwpss, "rb") as fin:
+        thetas, chis, all_stokes = pickle.load(fin)
+    thetas = np.ascontiguousarray(thetas, dtype=np.float64)
+    chis = np.ascontiguousarray(chis, dtype=np.float64)
+    freqs = tuple(sorted(all_stokes))
+    tables = {
+        kind: np.ascontiguousarray(
+            [all_stokes[freq][kind] for freq in freqs], dtype=np.float32
+        )
+        for kind in ("transmission", "reflection", "emission")
+    }
+    return thetas, chis, freqs, tables
+
+
+def _interp_weights(x, xp):
+    """Linear interpolation indices and weights of x on the grid xp.
+
+    The result reproduces np.interp(x, xp, fp) as
+    fp[idx] + frac * (fp[idx + 1] - fp[idx]), including the clamping to the
+    end points, so that the same weights can be reused for many fp.
+
+    """
+    idx = np.searchsorted(xp, x, side="right") - 1
+    np.clip(idx, 0, len(xp) - 2, out=idx)
+    frac = (x - xp[idx]) / (xp[idx + 1] - xp[idx])
+    np.clip(frac, 0, 1, out=frac)
+    return idx, frac
+
+
+def _observe_stokes(iqu, idx, frac, weights, low, high, out):
+    """Interpolate stacked I, Q, U profiles to the HWP angles and project
+    them with the (3,) detector polarization weights.
+
+    iqu has shape (nprofile, 3, nchi) and idx, frac come from
+    _interp_weights.  low and high are (nprofile, 3, nsamp) scratch buffers
+    and the (nprofile, nsamp) result is written to out.
+    """
+    np.take(iqu, idx, axis=-1, out=low)
+    np.take(iqu, idx + 1, axis=-1, out=high)
+    high -= low
+    high *= frac
+    low += high
+    return np.matmul(weights, low, out=out)
+
 
 class OpSimHWPSS(toast.Operator):
     """ Simulate HWP synchronous signal """
@@ -30,70 +99,130 @@ class OpSimHWPSS(toast.Operator):
         # theta is the incident angle, also known as the radial distance
         #     to the boresight.
         # chi is the HWP rotation angle
+        # The database is only read when the operator is first executed.
 
-        with open(fname_hwpss, "rb") as fin:
-            self.thetas, self.chis, self.all_stokes = pickle.load(fin)
+        self.thetas = None
+        self.chis = None
+        self.freqs = None
+        self.all_stokes = None
 
         self._mc = mc
+        self._fp_cache = {}
 
         return
 
+    def _load_tables(self):
+        if self.all_stokes is None:
+            (
+                self.thetas, self.chis, self.freqs, self.all_stokes
+            ) = _load_hwpss(self.fname_hwpss)
+        return self.all_stokes
+
+    def _detector_tables(self, focalplane, dets):
+        """Band, polarization weights and incident angle interpolation of
+        the detectors, computed once per focalplane.
+
+        The cache entries keep a reference to their focalplane, so that an
+        id() reused by a new focalplane object is not mistaken for the old
+        one.
+        """
+        key = (id(focalplane), tuple(dets))
+        entry = self._fp_cache.get(key)
+        if entry is not None and entry[0] is focalplane:
+            tables = entry[1]
+        else:
+            quats = np.array([focalplane[det]["quat"] for det in dets])
+            det_theta, det_phi, det_psi = qa.to_angles(quats.reshape(-1, 4))
+            det_psi = np.atleast_1d(det_psi)
+
+            # Get polarization weights
+
+            weights = np.column_stack(
+                [np.ones_like(det_psi), np.cos(2 * det_psi), np.sin(2 * det_psi)]
+            ).astype(np.float32)
+
+            # Interpolation of HWPSS to incident angle
+
+            theta_deg = np.degrees(np.atleast_1d(det_theta))
+            itheta_high = np.searchsorted(self.thetas, theta_deg)
+            itheta_low = itheta_high - 1
+
+            theta_low = self.thetas[itheta_low]
+            theta_high = self.thetas[itheta_high]
+            r = (theta_deg - theta_low) / (theta_high - theta_low)
+
+            # Index of the band frequency in the stacked HWPSS tables
+
+            ifreq = np.array(
+                [
+                    self.freqs.index(BAND_FREQ[focalplane[det]["band"]])
+                    for det in dets
+                ],
+                dtype=np.int64,
+            )
+
+            tables = {
+                "ifreq": ifreq,
+                "weights": weights,
+                "itheta_low": itheta_low,
+                "itheta_high": itheta_high,
+                "r": r.astype(np.float32),
+            }
+            self._fp_cache[key] = (focalplane, tables)
+        return tables
+
     def exec(self, data):
-        
+        self._load_tables()
+
         for obs in data.obs:
             tod = obs["tod"]
             focalplane = obs["focalplane"]
-            # Get HWP angle
+            dets = tod.local_dets
+            det_tables = self._detector_tables(focalplane, dets)
+            # Get HWP angle, and its interpolation weights on the HWPSS
+            # grid, shared by all detectors and Stokes parameters.
             chi = tod.local_hwp_angle()
-            for det in tod.local_dets:
+            chi_idx, chi_frac = _interp_weights(chi, self.chis)
+            chi_frac = chi_frac.astype(np.float32)
+            # Scratch space reused by every detector.  The transmitted plus
+            # reflected and the emitted profiles are interpolated together.
+            nsamp = len(chi)
+            nchi = len(self.chis)
+            profiles = np.empty((2, 3, nchi), dtype=np.float32)
+            low = np.empty((2, 3, nsamp), dtype=np.float32)
+            high = np.empty((2, 3, nsamp), dtype=np.float32)
+            observed = np.empty((2, nsamp), dtype=np.float32)
+            # Boresight pointing in horizontal coordinates, shared by all
+            # detectors
+            azelbore = tod.read_boresight_azel()
+            detquats = tod.detoffset()
+            for idet, det in enumerate(dets):
                 signal = tod.local_signal(det, self._name)
-                band = focalplane[det]["band"]
-                freq = {
-                    "SAT_f030" : "027",
-                    "SAT_f040" : "039",
-                    "SAT_f090" : "093",
-                    "SAT_f150" : "145",
-                    "SAT_f230" : "225",
-                    "SAT_f290" : "278",
-                }[band]
-
-                # Get incident angle
-                
-                det_quat = focalplane[det]["quat"]
-                det_theta, det_phi, det_psi = qa.to_angles(det_quat)
-                
+                ifreq = det_tables["ifreq"][idet]
+                weights = det_tables["weights"][idet]
+
                 # Get observing elevation
-                
-                azelquat = tod.read_pntg(detector=det, azel=True)
-                el = np.pi / 2 - qa.to_position(azelquat)[0]
 
-                # Get polarization weights
+                azelquat = qa.mult(azelbore, detquats[det])
+                el = np.pi / 2 - qa.to_position(azelquat)[0]
 
-                iweights = np.ones(signal.size)
-                qweights = np.cos(2 * det_psi)
-                uweights = np.sin(2 * det_psi)
-        
                 # Interpolate HWPSS to incident angle
 
-                theta_deg = np.degrees(det_theta)
-                itheta_high = np.searchsorted(self.thetas, theta_deg)
-                itheta_low = itheta_high - 1
-
-                theta_low = self.thetas[itheta_low]
-                theta_high = self.thetas[itheta_high]
-                r = (theta_deg - theta_low) / (theta_high - theta_low)
+                itheta_low = det_tables["itheta_low"][idet]
+                itheta_high = det_tables["itheta_high"][idet]
+                r = det_tables["r"][idet]
 
                 transmission = (
-                    (1 - r) * self.all_stokes[freq]["transmission"][itheta_low]
-                    + r * self.all_stokes[freq]["transmission"][itheta_high]
+                    (1 - r) * self.all_stokes["transmission"][ifreq, itheta_low]
+                    + r * self.all_stokes["transmission"][ifreq, itheta_high]
                 )
                 reflection = (
-                    (1 - r) * self.all_stokes[freq]["reflection"][itheta_low]
-                    + r * self.all_stokes[freq]["reflection"][itheta_high]
+                    (1 - r) * self.all_stokes["reflection"][ifreq, itheta_low]
+                    + r * self.all_stokes["reflection"][ifreq, itheta_high]
                 )
                 emission = (
-                    (1 - r) * self.all_stokes[freq]["emission"][itheta_low]
-                    + r * self.all_stokes[freq]["emission"][itheta_high]
+                    (1 - r) * self.all_stokes["emission"][ifreq, itheta_low]
+                    + r * self.all_stokes["emission"][ifreq, itheta_high]
                 )
                 
                 # Scale HWPSS for observing elevation
@@ -103,19 +232,14 @@ class OpSimHWPSS(toast.Operator):
                 
                 # Observe HWPSS with the detector
 
-                iquv = (transmission + reflection).T
-                iquss = (
-                    iweights * np.interp(chi, self.chis, iquv[0]) +
-                    qweights * np.interp(chi, self.chis, iquv[1]) +
-                    uweights * np.interp(chi, self.chis, iquv[2])
-                ) * scale
-
-                iquv = emission.T
-                iquss += (
-                    iweights * np.interp(chi, self.chis, iquv[0]) +
-                    qweights * np.interp(chi, self.chis, iquv[1]) +
-                    uweights * np.interp(chi, self.chis, iquv[2])
+                np.add(transmission.T[:3], reflection.T[:3], out=profiles[0])
+                profiles[1] = emission.T[:3]
+                _observe_stokes(
+                    profiles, chi_idx, chi_frac, weights, low, high, observed
                 )
+                iquss = observed[0]
+                iquss *= scale
+                iquss += observed[1]
 
                 iquss -= np.median(iquss)
 
@@ -123,4 +247,8 @@ class OpSimHWPSS(toast.Operator):
 
                 signal += iquss
 
+        # Observations in this data set share the detector tables, but do
+        # not hold on to them (or their focalplanes) between calls.
+        self._fp_cache.clear()
+
         return
@@ -4,8 +4,8 @@
 """Hardware visualization tools.
 """
 
+import math
 import numpy as np
-import quaternionarray as qa
 import warnings
 
 
@@ -20,21 +20,241 @@ default_band_colors = {
 }
 
 
+def _rotate_zaxis(quats):
+    """Rotate the Z axis by an (N, 4) array of quaternions.
+
+    This is the closed form of qa.rotate(quats, zaxis) for the quaternionarray
+    (x, y, z, w) convention, without building the intermediate products.
+    """
+    x, y, z, w = quats.T
+    return np.column_stack([
+        2.0 * (x * z + w * y),
+        2.0 * (y * z - w * x),
+        w * w - x * x - y * y + z * z,
+    ])
+
+
+def _rotate_xaxis(quats):
+    """Rotate the X axis by an (N, 4) array of quaternions.
+
+    This is the closed form of qa.rotate(quats, xaxis) for the quaternionarray
+    (x, y, z, w) convention, without building the intermediate products.
+    """
+    x, y, z, w = quats.T
+    return np.column_stack([
+        w * w + x * x - y * y - z * z,
+        2.0 * (x * y + w * z),
+        2.0 * (x * z - w * y),
+    ])
+
+
+# pyplot, once the PDF backend has been selected
+_PLT = None
+
+
 def set_matplotlib_pdf_backend():
     """Set the matplotlib backend to PDF
 
-    This is necessary to render properly the focal plane plots"""
+    This is necessary to render properly the focal plane plots.  The backend
+    is only switched again if something else changed it since the last call.
+    """
+    global _PLT
 
     import matplotlib
 
-    matplotlib.use("pdf")
-    import matplotlib.pyplot as plt
+    if _PLT is None or matplotlib.get_backend().lower() != "pdf":
+        matplotlib.use("pdf")
+        import matplotlib.pyplot as plt
+
+        _PLT = plt
+
+    return _PLT
+
+
+def _detector_columns(dets):
+    """Gather the detector properties used for plotting into arrays.
+
+    Args:
+        dets (dict): Dictionary of detector properties.
+
+    Returns:
+        (dict): One array per property ("quat", "fwhm", "band", "pol",
+            "wafer_slot", "pixel") with one row per detector, in the order of
+            dets.
+
+    """
+    props = list(dets.values())
+    return {
+        "quat": np.array(
+            [p["quat"] for p in props], dtype=np.float64
+        ).reshape(-1, 4),
+        "fwhm": np.fromiter(
+            (p["fwhm"] for p in props), dtype=np.float64, count=len(props)
+        ),
+        "band": np.array([p["band"] for p in props]),
+        "pol": np.array([p["pol"] for p in props]),
+        "wafer_slot": np.array([p["wafer_slot"] for p in props]),
+        "pixel": np.array([p["pixel"] for p in props]),
+    }
+
+
+def _detector_geometry(columns):
+    """Projected geometry of the detectors.
+
+    Args:
+        columns (dict): Detector property arrays from _detector_columns.
+
+    Returns:
+        (dict): Arrays with one row per detector, in the order of dets.
+            "dirs" and "orients" are the (N, 3) rotated Z and X axes, "radius"
+            is the detector radius, "xpos" and "ypos" the projected position
+            (all in degrees) and "cospol" and "sinpol" the components of the
+            polarization orientation.
+
+    """
+    quats = columns["quat"]
+    dirs = _rotate_zaxis(quats)
+    orients = _rotate_xaxis(quats)
+
+    # radius in degrees
+    detradii = 0.5 * columns["fwhm"] / 60.0
+
+    # rotation from boresight
+    angs = np.arctan2(dirs[:, 1], dirs[:, 0])
+    polangs = np.arctan2(orients[:, 1], orients[:, 0])
+
+    mags = np.degrees(np.arccos(dirs[:, 2]))
+
+    return {
+        "dirs": dirs,
+        "orients": orients,
+        "radius": detradii,
+        "xpos": mags * np.cos(angs),
+        "ypos": mags * np.sin(angs),
+        "cospol": np.cos(polangs),
+        "sinpol": np.sin(polangs),
+    }
+
+
+def _plot_extent(dirs, width, height):
+    """Plot window (wmin, wmax, hmin, hmax) in degrees.
+
+    If either width or height is None, the window is autoscaled to the
+    angular extent of the detector directions plus a 10% buffer.
+    Otherwise it is centered on the boresight.
+
+    """
+    if (width is None) or (height is None):
+        # We are autoscaling.  Compute the angular extent of all detectors
+        # and add some buffer.
+        wmin = 1.0
+        wmax = -1.0
+        hmin = 1.0
+        hmax = -1.0
+        if len(dirs) > 0:
+            wmin = min(wmin, dirs[:, 0].min())
+            wmax = max(wmax, dirs[:, 0].max())
+            hmin = min(hmin, dirs[:, 1].min())
+            hmax = max(hmax, dirs[:, 1].max())
+        wmin = math.degrees(math.asin(wmin))
+        wmax = math.degrees(math.asin(wmax))
+        hmin = math.degrees(math.asin(hmin))
+        hmax = math.degrees(math.asin(hmax))
+        wbuf = 0.1 * (wmax - wmin)
+        hbuf = 0.1 * (hmax - hmin)
+        wmin -= wbuf
+        wmax += wbuf
+        hmin -= hbuf
+        hmax += hbuf
+    else:
+        half_width = 0.5 * width
+        half_height = 0.5 * height
+        wmin = -half_width
+        wmax = half_width
+        hmin = -half_height
+        hmax = half_height
+    return wmin, wmax, hmin, hmax
+
+
+def _wafer_centers(wslots, dirs):
+    """Average position in degrees of the detectors of each wafer_slot.
+
+    This is where the wafer_slot labels are placed.  The wafers are in the
+    order they first appear in wslots.
+
+    """
+    wafer_centers = dict()
+    wafers, wfirst, wcodes = np.unique(
+        wslots, return_index=True, return_inverse=True
+    )
+    xdeg = np.degrees(np.arcsin(dirs[:, 0]))
+    ydeg = np.degrees(np.arcsin(dirs[:, 1]))
+    wcounts = np.bincount(wcodes, minlength=len(wafers))
+    wxsum = np.bincount(wcodes, weights=xdeg, minlength=len(wafers))
+    wysum = np.bincount(wcodes, weights=ydeg, minlength=len(wafers))
+    for iw in np.argsort(wfirst):
+        wafer_centers[str(wafers[iw])] = {
+            "x": wxsum[iw] / wcounts[iw],
+            "y": wysum[iw] / wcounts[iw],
+            "n": int(wcounts[iw]),
+        }
+    return wafer_centers
+
+
+def compute_detector_layout(dets, width=None, height=None):
+    """Compute the projected positions of a dictionary of detectors.
+
+    This does all the numerical work needed by plot_detectors without
+    importing matplotlib, so the result can be computed in headless code and
+    reused for several plots.  If width and height restrict the view,
+    detectors that cannot reach into the plot window are dropped.
+
+    Args:
+        dets (dict): Dictionary of detector properties.
+        width (float): Width of plot in degrees (None = autoscale).
+        height (float): Height of plot in degrees (None = autoscale).
+
+    Returns:
+        (dict): The per-detector arrays "xpos", "ypos", "cospol", "sinpol",
+            "radius", "band", "pol", "pixel" and "wafer_slot", the plot
+            "extent" as (wmin, wmax, hmin, hmax) and the "wafer_centers".
 
-    return plt
+    """
+    columns = _detector_columns(dets)
+    geom = _detector_geometry(columns)
+
+    extent = _plot_extent(geom["dirs"], width, height)
+    wmin, wmax, hmin, hmax = extent
+
+    # To decide where to place each wafer_slot label, we find the average
+    # location of all detectors from each wafer and put the label there.
+    wafer_centers = _wafer_centers(columns["wafer_slot"], geom["dirs"])
+
+    # Only keep the detectors that can reach into the plot window.  The
+    # margin covers the polarization arrow (1.5 radii from the center) and
+    # its label.
+    margin = 3.0 * geom["radius"]
+    visible = (
+        (geom["xpos"] + margin >= wmin) & (geom["xpos"] - margin <= wmax)
+        & (geom["ypos"] + margin >= hmin) & (geom["ypos"] - margin <= hmax)
+    )
+    if np.all(visible):
+        visible = slice(None)
+
+    layout = {
+        k: geom[k][visible]
+        for k in ("xpos", "ypos", "cospol", "sinpol", "radius")
+    }
+    for k in ("band", "pol", "pixel", "wafer_slot"):
+        layout[k] = columns[k][visible]
+    layout["extent"] = extent
+    layout["wafer_centers"] = wafer_centers
+    return layout
 
 
 def plot_detectors(
-    dets, outfile, width=None, height=None, labels=False, bandcolor=None
+    dets, outfile, width=None, height=None, labels=False, bandcolor=None,
+    raster_dpi=None, layout=None
 ):
     """Visualize a dictionary of detectors.
 
@@ -50,11 +270,30 @@ def plot_detectors(
         height (float): Height of plot in degrees (None = autoscale).
         labels (bool): If True, label each detector.
         bandcolor (dict, optional): Dictionary of color values for each band.
+        raster_dpi (float, optional): If set, rasterize the detector circles
+            and polarization arrows at this resolution instead of writing
+            them as vector shapes, which is much smaller and faster for large
+            focalplanes.  Axes and labels stay vector graphics.
+        layout (dict, optional): A precomputed result of
+            compute_detector_layout to plot instead of computing it from dets,
+            width and height.
 
     Returns:
         None
 
     """
+    if layout is None:
+        layout = compute_detector_layout(dets, width=width, height=height)
+    wmin, wmax, hmin, hmax = layout["extent"]
+    width = wmax - wmin
+    height = hmax - hmin
+
+    detradii = layout["radius"]
+    xposs = layout["xpos"]
+    yposs = layout["ypos"]
+    cospols = layout["cospol"]
+    sinpols = layout["sinpol"]
+
     try:
         plt = set_matplotlib_pdf_backend()
     except:
@@ -64,67 +303,10 @@ focal plane plots will not render properly,
 proceeding with the default matplotlib backend"""
         )
         import matplotlib.pyplot as plt
+    from matplotlib.collections import EllipseCollection, PolyCollection
+    from matplotlib.colors import to_rgba_array
 
-    xaxis = np.array([1.0, 0.0, 0.0], dtype=np.float64)
-    zaxis = np.array([0.0, 0.0, 1.0], dtype=np.float64)
-    wmin = 1.0
-    wmax = -1.0
-    hmin = 1.0
-    hmax = -1.0
-    if (width is None) or (height is None):
-        # We are autoscaling.  Compute the angular extent of all detectors
-        # and add some buffer.
-        for d, props in dets.items():
-            quat = np.array(props["quat"]).astype(np.float64)
-            dir = qa.rotate(quat, zaxis).flatten()
-            if (dir[0] > wmax):
-                wmax = dir[0]
-            if (dir[0] < wmin):
-                wmin = dir[0]
-            if (dir[1] > hmax):
-                hmax = dir[1]
-            if (dir[1] < hmin):
-                hmin = dir[1]
-        wmin = np.arcsin(wmin) * 180.0 / np.pi
-        wmax = np.arcsin(wmax) * 180.0 / np.pi
-        hmin = np.arcsin(hmin) * 180.0 / np.pi
-        hmax = np.arcsin(hmax) * 180.0 / np.pi
-        wbuf = 0.1 * (wmax - wmin)
-        hbuf = 0.1 * (hmax - hmin)
-        wmin -= wbuf
-        wmax += wbuf
-        hmin -= hbuf
-        hmax += hbuf
-        width = wmax - wmin
-        height = hmax - hmin
-    else:
-        half_width = 0.5 * width
-        half_height = 0.5 * height
-        wmin = -half_width
-        wmax = half_width
-        hmin = -half_height
-        hmax = half_height
-
-    wafer_centers = dict()
-    if labels:
-        # We are plotting labels and will want to plot a wafer_slot label for each
-        # wafer.  To decide where to place the label, we find the average location
-        # of all detectors from each wafer and put the label there.
-        for d, props in dets.items():
-            dwslot = props["wafer_slot"]
-            if dwslot not in wafer_centers:
-                wafer_centers[dwslot] = dict()
-                wafer_centers[dwslot]["x"] = 0.0
-                wafer_centers[dwslot]["y"] = 0.0
-                wafer_centers[dwslot]["n"] = 0
-            quat = np.array(props["quat"]).astype(np.float64)
-            dir = qa.rotate(quat, zaxis).flatten()
-            wafer_centers[dwslot]["x"] += np.arcsin(dir[0]) * 180.0 / np.pi
-            wafer_centers[dwslot]["y"] += np.arcsin(dir[1]) * 180.0 / np.pi
-            wafer_centers[dwslot]["n"] += 1
-        for k in wafer_centers.keys():
-            wafer_centers[k]["x"] /= wafer_centers[k]["n"]
-            wafer_centers[k]["y"] /= wafer_centers[k]["n"]
+    ascale = 1.5
 
     if bandcolor is None:
         bandcolor = default_band_colors
@@ -142,77 +324,93 @@ proceeding with the default matplotlib backend"""
     ax.set_xlim([wmin, wmax])
     ax.set_ylim([hmin, hmax])
 
+    # Text boxes shared by all labels.  Each Text copies the properties, so
+    # the same dictionaries can be passed to every call.
+    label_bbox = dict(fc='white', ec='none', pad=0.2, alpha=1.0)
+    pol_bbox = dict(fc='none', ec='none', pad=0, alpha=1.0)
+
     # Draw wafer labels in the background
     if labels:
         # Compute the font size to use for detector labels
         fontpix = 0.2 * ypixperdeg
-        for k, v in wafer_centers.items():
+        for k, v in layout["wafer_centers"].items():
             ax.text(v["x"] + 0.2, v["y"], k,
                     color='k', fontsize=fontpix, horizontalalignment='center',
-                    verticalalignment='center',
-                    bbox=dict(fc='white', ec='none', pad=0.2, alpha=1.0))
-
-    for d, props in dets.items():
-        band = props["band"]
-        pixel = props["pixel"]
-        pol = props["pol"]
-        quat = np.array(props["quat"]).astype(np.float64)
-        fwhm = props["fwhm"]
+                    verticalalignment='center', bbox=label_bbox)
+
+    # Face colors by band and arrow colors by polarization, looked up once
+    # per distinct value
+    pols = layout["pol"]
+    ubands, bcodes = np.unique(layout["band"], return_inverse=True)
+    detfaces = to_rgba_array([bandcolor[b] for b in ubands])[bcodes]
+    detcolors = np.zeros((len(pols), 4))
+    detcolors[:, 3] = 1.0
+    detcolors[pols == "A"] = (1.0, 0.0, 0.0, 1.0)
+    detcolors[pols == "B"] = (0.0, 0.0, 1.0, 1.0)
+
+    # Draw all detector circles as a single collection
+    rasterized = raster_dpi is not None
+    circles = EllipseCollection(
+        2.0 * detradii, 2.0 * detradii, 0.0, units="xy",
+        offsets=np.column_stack([xposs, yposs]),
+        offset_transform=ax.transData, facecolors=detfaces,
+        edgecolors="black", linewidths=0.05 * detradii,
+        rasterized=rasterized,
+    )
+    ax.add_collection(circles, autolim=False)
+
+    # Polarization arrows through the detector centers
+
+    # Half the arrow extent along the polarization direction
+    dxhalf = ascale * detradii * cospols
+    dyhalf = ascale * detradii * sinpols
+
+    xtails = xposs - dxhalf
+    ytails = yposs - dyhalf
+    dxs = 2.0 * dxhalf
+    dys = 2.0 * dyhalf
+
+    # Draw all arrows as a single collection of outlines.  Each arrow has a
+    # shaft of width 0.1 and a head of width and length 0.3 detector radii,
+    # written in units of the radius along and across the arrow direction.
+    headbase = 2.0 * ascale - 0.3
+    along = np.array([0.0, headbase, headbase, 2.0 * ascale, headbase,
+                      headbase, 0.0])
+    across = np.array([0.05, 0.05, 0.15, 0.0, -0.15, -0.05, -0.05])
+    rcos = (detradii * cospols)[:, None]
+    rsin = (detradii * sinpols)[:, None]
+    arrowverts = np.empty((len(detradii), len(along), 2))
+    arrowverts[:, :, 0] = xtails[:, None] + along * rcos - across * rsin
+    arrowverts[:, :, 1] = ytails[:, None] + along * rsin + across * rcos
+    arrows = PolyCollection(
+        arrowverts, closed=True, facecolors=detcolors, edgecolors="none",
+        rasterized=rasterized,
+    )
+    ax.add_collection(arrows, autolim=False)
 
-        # radius in degrees
-        detradius = 0.5 * fwhm / 60.0
-
-        # rotation from boresight
-        rdir = qa.rotate(quat, zaxis).flatten()
-        ang = np.arctan2(rdir[1], rdir[0])
-
-        orient = qa.rotate(quat, xaxis).flatten()
-        polang = np.arctan2(orient[1], orient[0])
-
-        mag = np.arccos(rdir[2]) * 180.0 / np.pi
-        xpos = mag * np.cos(ang)
-        ypos = mag * np.sin(ang)
-
-        detface = bandcolor[band]
-
-        circ = plt.Circle((xpos, ypos), radius=detradius, fc=detface,
-                          ec="black", linewidth=0.05*detradius)
-        ax.add_artist(circ)
-
-        ascale = 1.5
-
-        xtail = xpos - ascale * detradius * np.cos(polang)
-        ytail = ypos - ascale * detradius * np.sin(polang)
-        dx = ascale * 2.0 * detradius * np.cos(polang)
-        dy = ascale * 2.0 * detradius * np.sin(polang)
-
-        detcolor = "black"
-        if pol == "A":
-            detcolor = (1.0, 0.0, 0.0, 1.0)
-        if pol == "B":
-            detcolor = (0.0, 0.0, 1.0, 1.0)
-
-        ax.arrow(xtail, ytail, dx, dy, width=0.1*detradius,
-                 head_width=0.3*detradius, head_length=0.3*detradius,
-                 fc=detcolor, ec="none", length_includes_head=True)
-
-        if labels:
-            # Compute the font size to use for detector labels
-            fontpix = 0.1 * detradius * ypixperdeg
-            ax.text((xpos), (ypos), pixel,
+    if labels:
+        # Compute the font size and polarization label offset to use for
+        # detector labels
+        fontpixs = 0.1 * detradii * ypixperdeg
+        xsgns = np.where(dxs < 0.0, -1.0, 1.0)
+        pollens = np.char.str_len(pols)
+        labeloffs = 1.0 * xsgns * fontpixs * pollens / ypixperdeg
+        xlabels = xtails + 1.0 * dxs + labeloffs
+        ylabels = ytails + 1.0 * dys
+        pixels = layout["pixel"]
+        for idet in range(len(pixels)):
+            fontpix = fontpixs[idet]
+            ax.text(xposs[idet], yposs[idet], pixels[idet],
                     color='k', fontsize=fontpix, horizontalalignment='center',
-                    verticalalignment='center',
-                    bbox=dict(fc='white', ec='none', pad=0.2, alpha=1.0))
-            xsgn = 1.0
-            if dx < 0.0:
-                xsgn = -1.0
-            labeloff = 1.0 * xsgn * fontpix * len(pol) / ypixperdeg
-            ax.text((xtail+1.0*dx+labeloff), (ytail+1.0*dy), pol,
+                    verticalalignment='center', bbox=label_bbox)
+            ax.text(xlabels[idet], ylabels[idet], pols[idet],
                     color='k', fontsize=fontpix, horizontalalignment='center',
-                    verticalalignment='center',
-                    bbox=dict(fc='none', ec='none', pad=0, alpha=1.0))
+                    verticalalignment='center', bbox=pol_bbox)
 
-    plt.savefig(outfile)
+    if rasterized:
+        plt.savefig(outfile, dpi=raster_dpi)
+    else:
+        plt.savefig(outfile)
     plt.close()
     return
 
@@ -251,15 +449,21 @@ def summary_text(hw):
         print("{}{:<12}: {}{:5d} objects{}".format(clr.WHITE, obj, clr.RED,
                                                    nsub, clr.ENDC))
         if nsub <= 2000:
-            line = ""
-            for k in list(props.keys()):
-                if (len(line) + len(k)) > 72:
-                    print("    {}{}{}".format(clr.BLUE, line, clr.ENDC))
-                    line = ""
-                line = "{}{}, ".format(line, k)
+            # Wrap the names into lines of about 72 characters.  The names
+            # of the current line are only joined when it is printed.
+            line = list()
+            linelen = 0
+            for k in props.keys():
+                if (linelen + len(k)) > 72:
+                    text = "".join(line)
+                    print(f"    {clr.BLUE}{text}{clr.ENDC}")
+                    line.clear()
+                    linelen = 0
+                line.append(f"{k}, ")
+                linelen += len(line[-1])
             if len(line) > 0:
-                print("    {}{}{}".format(clr.BLUE, line.rstrip(", "),
-                      clr.ENDC))
+                text = "".join(line).rstrip(", ")
+                print(f"    {clr.BLUE}{text}{clr.ENDC}")
         else:
             # Too many to print!
             print("    {}(Too many to print){}".format(clr.BLUE, clr.ENDC))
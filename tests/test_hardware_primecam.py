@@ -0,0 +1,260 @@
+# Copyright (c) 2018-2019 Simons Observatory.
+# Full license can be found in the top level "LICENSE" file.
+"""Test Prime-Cam wafer detector simulation.
+"""
+
+import copy
+import os
+import sys
+
+import unittest
+from unittest import TestCase
+
+from collections import OrderedDict
+
+import numpy as np
+
+import quaternionarray as qa
+
+from ._helpers import create_outdir, mpi_multi
+
+from sotodlib.sim_hardware_primecam import (
+    get_example, hex_layout, hex_nring, hex_row_col, rhomb_dim,
+    rhomb_row_col, rhombus_hex_layout, sim_wafer_detector_table,
+    sim_wafer_detectors,
+)
+
+from sotodlib.vis_hardware_primecam import (
+    compute_detector_layout, plot_detectors,
+)
+
+from sotodlib.scripts import hardware_plot_primecam
+
+
+def reference_wafer_detectors(hw, wafer_slot, platescale, fwhm, center):
+    """Build the detector properties of a wafer one detector at a time."""
+    wprops = hw.data["wafer_slots"][wafer_slot]
+    card_slot = wprops["card_slot"]
+    cardprops = hw.data["card_slots"][card_slot]
+    bands = wprops["bands"]
+    npix = wprops["npixel"]
+    pixsep = platescale * wprops["pixsize"]
+    handed = None
+    kill = []
+    if wprops["packing"] == "F":
+        gap = platescale * wprops["rhombusgap"]
+        nrhombus = npix // 3
+        dim = rhomb_dim(nrhombus)
+        width = (dim - 1) * pixsep
+        pol_A = np.zeros(nrhombus, dtype=np.float64)
+        for p in range(nrhombus):
+            row, col = rhomb_row_col(nrhombus, p)
+            pol_A[p] = (0.0 if row % 2 == 0 else 45.0) + 22.5
+        pol_B = 90.0 + pol_A
+        kf = dim * (dim - 1) // 2
+        kill = [(dim*dim+kf), (dim*dim+kf) + dim - 2]
+        layout_A = rhombus_hex_layout(nrhombus, width, gap,
+                                      rhombus_rotate=pol_A, killpix=kill)
+        layout_B = rhombus_hex_layout(nrhombus, width, gap,
+                                      rhombus_rotate=pol_B, killpix=kill)
+    else:
+        width = (2 * (hex_nring(npix) - 1)) * pixsep
+        handed = list()
+        pol_A = np.zeros(npix, dtype=np.float64)
+        for p in range(npix):
+            row, col = hex_row_col(npix, p)
+            handed.append("L" if col % 2 == 0 else "R")
+            pol_A[p] = 0.0 if col % 4 < 2 else 45.0
+        pol_B = 90.0 + pol_A
+        layout_A = hex_layout(npix, width, rotate=pol_A)
+        layout_B = hex_layout(npix, width, rotate=pol_B)
+
+    chan_per_AMC = 910
+    chan_per_mux = 64
+    chan_per_bias = cardprops["nchannel"] // cardprops["nbias"]
+    dets = OrderedDict()
+    doff = 0
+    p = 0
+    idoff = int(wafer_slot[-2:]) * 10000
+    for px in range(npix):
+        if px in kill:
+            continue
+        pstr = "{:03d}".format(p)
+        for b in bands:
+            for pl, layout in zip(["A", "B"], [layout_A, layout_B]):
+                dprops = OrderedDict()
+                dprops["wafer_slot"] = wafer_slot
+                dprops["ID"] = idoff + doff
+                dprops["pixel"] = pstr
+                dprops["band"] = b
+                dprops["fwhm"] = fwhm[b]
+                dprops["pol"] = pl
+                if handed is not None:
+                    dprops["handed"] = handed[p]
+                dprops["card_slot"] = card_slot
+                dprops["channel"] = doff
+                dprops["AMC"] = doff // chan_per_AMC
+                dprops["bias"] = doff // chan_per_bias
+                dprops["bondpad"] = doff % chan_per_mux
+                dprops["mux_position"] = doff // chan_per_mux
+                dprops["quat"] = qa.mult(center, layout[p]).flatten()
+                dprops["detector_name"] = ""
+                dets["{}_p{}_{}_{}".format(wafer_slot, pstr, b, pl)] = dprops
+                doff += 1
+        p += 1
+    return dets
+
+
+@unittest.skipIf(mpi_multi(), "Running with multiple MPI processes")
+class HardwarePrimecamTest(TestCase):
+
+    def setUp(self):
+        self.hw = get_example()
+        teleprops = self.hw.data["telescopes"]["LAT"]
+        self.platescale = teleprops["platescale"]
+        self.fwhm = teleprops["fwhm"]
+        self.center = np.array([0.01, -0.02, 0.03, 1.0])
+        self.center /= np.linalg.norm(self.center)
+        # The example only has rhombus (feedhorn) wafers, so make a copy of
+        # one wafer with hexagonal (sinuous) packing.
+        hexprops = copy.deepcopy(self.hw.data["wafer_slots"]["w00"])
+        hexprops["packing"] = "S"
+        hexprops["npixel"] = 19
+        self.hw.data["wafer_slots"]["w99"] = hexprops
+
+    def check_wafer(self, wafer_slot):
+        ref = reference_wafer_detectors(
+            self.hw, wafer_slot, self.platescale, self.fwhm, self.center)
+
+        dets = sim_wafer_detectors(
+            self.hw, wafer_slot, self.platescale, self.fwhm,
+            center=self.center)
+        self.assertEqual(list(dets.keys()), list(ref.keys()))
+        for dname, rprops in ref.items():
+            props = dets[dname]
+            self.assertEqual(list(props.keys()), list(rprops.keys()))
+            for k, v in rprops.items():
+                if k == "quat":
+                    np.testing.assert_allclose(props[k], v, rtol=0,
+                                               atol=1.0e-12)
+                else:
+                    self.assertEqual(props[k], v)
+                    self.assertEqual(type(props[k]), type(v))
+
+        table = sim_wafer_detector_table(
+            self.hw, wafer_slot, self.platescale, self.fwhm,
+            center=self.center, boresight=True)
+        self.assertEqual(table["name"], list(ref.keys()))
+        for k in rprops.keys():
+            col = [x[k] for x in ref.values()]
+            if k == "quat":
+                np.testing.assert_allclose(table[k], np.array(col), rtol=0,
+                                           atol=1.0e-12)
+            else:
+                self.assertEqual(list(table[k]), col)
+        zaxis = np.array([0.0, 0.0, 1.0])
+        np.testing.assert_allclose(
+            table["boresight"], qa.rotate(table["quat"], zaxis), rtol=0,
+            atol=1.0e-12)
+
+        # The line of sight vectors are only computed on request
+        table = sim_wafer_detector_table(
+            self.hw, wafer_slot, self.platescale, self.fwhm)
+        self.assertNotIn("boresight", table)
+        return
+
+    def test_rhombus_wafer(self):
+        self.check_wafer("w00")
+        return
+
+    def test_hex_wafer(self):
+        self.check_wafer("w99")
+        return
+
+
+@unittest.skipIf(mpi_multi(), "Running with multiple MPI processes")
+class VisPrimecamTest(TestCase):
+
+    def setUp(self):
+        fixture_name = os.path.splitext(os.path.basename(__file__))[0]
+        self.outdir = create_outdir(fixture_name)
+        self.skip_plots = False
+        if "SOTODLIB_TEST_DISABLE_PLOTS" in os.environ:
+            self.skip_plots = os.environ["SOTODLIB_TEST_DISABLE_PLOTS"]
+        self.hw = get_example()
+        teleprops = self.hw.data["telescopes"]["LAT"]
+        band = self.hw.data["wafer_slots"]["w00"]["bands"][0]
+        self.dets = sim_wafer_detectors(
+            self.hw, "w00", teleprops["platescale"], teleprops["fwhm"],
+            band=band)
+
+    def render(self, name, **kwargs):
+        import matplotlib.image as mpimg
+        outpath = os.path.join(self.outdir, name)
+        plot_detectors(self.dets, outpath, **kwargs)
+        return mpimg.imread(outpath)
+
+    def test_layout(self):
+        if self.skip_plots:
+            return
+        full = compute_detector_layout(self.dets)
+        ndet = len(self.dets)
+        self.assertEqual(len(full["xpos"]), ndet)
+
+        # A window over one corner of the wafer, which culls detectors
+        wmin, wmax, hmin, hmax = full["extent"]
+        width = 0.5 * (wmax - wmin)
+        height = 0.5 * (hmax - hmin)
+        layout = compute_detector_layout(self.dets, width=width,
+                                         height=height)
+        nkeep = len(layout["xpos"])
+        self.assertTrue(0 < nkeep < ndet)
+        for k in ("ypos", "cospol", "sinpol", "radius", "band", "pol",
+                  "pixel", "wafer_slot"):
+            self.assertEqual(len(layout[k]), nkeep)
+        self.assertEqual(layout["wafer_centers"], full["wafer_centers"])
+
+        # Plotting a precomputed layout draws the same as the default path
+        default = self.render("layout_default.png", width=width,
+                              height=height, labels=True)
+        given = self.render("layout_given.png", labels=True, layout=layout)
+        np.testing.assert_array_equal(given, default)
+
+        # The culled detectors do not reach into the window, so drawing all
+        # of them in the same window looks the same.
+        uncut = dict(full)
+        uncut["extent"] = layout["extent"]
+        allplot = self.render("layout_uncut.png", layout=uncut)
+        cutplot = self.render("layout_cut.png", layout=layout)
+        np.testing.assert_array_equal(cutplot, allplot)
+        return
+
+    def test_raster(self):
+        if self.skip_plots:
+            return
+        outpath = os.path.join(self.outdir, "wafer_w00_raster.pdf")
+        if os.path.isfile(outpath):
+            os.remove(outpath)
+        plot_detectors(self.dets, outpath, labels=True, raster_dpi=50)
+        self.assertTrue(os.path.getsize(outpath) > 0)
+
+        # The same through the command line tool
+        hwpath = os.path.join(self.outdir, "wafer_w00.toml.gz")
+        # Store the quaternions as plain floats, which every TOML writer
+        # understands.
+        self.hw.data["detectors"] = {
+            k: dict(v, quat=v["quat"].tolist()) for k, v in self.dets.items()
+        }
+        self.hw.dump(hwpath, overwrite=True, compress=True)
+        outpath = os.path.join(self.outdir, "wafer_w00_raster_cli.pdf")
+        if os.path.isfile(outpath):
+            os.remove(outpath)
+        argv = sys.argv
+        try:
+            sys.argv = ["primecam_hardware_plot", "--hardware", hwpath,
+                        "--out", outpath, "--raster-dpi", "50"]
+            hardware_plot_primecam.main()
+        finally:
+            sys.argv = argv
+        self.assertTrue(os.path.getsize(outpath) > 0)
+        return
@@ -30,6 +30,7 @@ if toast_available is None:
         from toast.todmap import TODGround
         from toast.tod import AnalyticNoise
         from sotodlib.toast.export import ToastExport
+        from sotodlib.toast.frame_utils import tod_to_frames, recode_timestream
         toast_available = True
     except ImportError:
         toast_available = False
@@ -140,6 +141,66 @@ class ToastExportTest(TestCase):
         self.data.obs.append(obs)
         return
 
+    def test_flags_unchanged(self):
+        if not toast_available:
+            return
+        tod = self.data.obs[0]["tod"]
+
+        # Set some flag bits which are not in the export mask
+        input_flags = dict()
+        for det in tod.local_dets:
+            flags = tod.local_flags(det)
+            flags[::7] = 3
+            input_flags[det] = np.array(flags)
+
+        tod_to_frames(tod, 0, 1, [0], [self.totsamp], mask_flag=1)
+
+        # Exporting must not apply the mask to the TOD's own flags
+        for det in tod.local_dets:
+            np.testing.assert_array_equal(tod.local_flags(det),
+                                          input_flags[det])
+        return
+
+    def test_gather_local_data(self):
+        if not toast_available:
+            return
+        nse = toast.tod.OpSimNoise(out="signal", realization=0)
+        nse.exec(self.data)
+        tod = self.data.obs[0]["tod"]
+
+        input_signal = {
+            det: np.array(tod.local_signal(det)) for det in tod.local_dets
+        }
+
+        fdata = tod_to_frames(tod, 0, 1, [0], [self.totsamp])
+
+        # Every process has all samples of its detectors, so the result on
+        # the root process must match its local data.
+        if self.rank == 0:
+            for det, sig in input_signal.items():
+                np.testing.assert_array_equal(
+                    np.array(fdata[0]["signal"][det]), sig)
+        for det, sig in input_signal.items():
+            np.testing.assert_array_equal(tod.local_signal(det), sig)
+        return
+
+    def test_recode_offset(self):
+        if not toast_available:
+            return
+        np.random.seed(123456)
+        data = 1.0 + np.random.normal(size=self.totsamp)
+        ts = core3g.G3Timestream(data)
+        ts.start = core3g.G3Time(0)
+        ts.stop = core3g.G3Time(1e8)
+
+        # A fixed offset, with the gain derived from the data
+        new_ts, gain, offset = recode_timestream(ts, {"offset": 1.0})
+        self.assertEqual(offset, 1.0)
+        self.assertEqual(new_ts.units, core3g.G3TimestreamUnits.Counts)
+        decoded = np.array(new_ts) / gain + offset
+        np.testing.assert_allclose(decoded, data, rtol=0, atol=0.5 / gain)
+        return
+
     # def test_dump(self):
     #     if not toast_available:
     #         return
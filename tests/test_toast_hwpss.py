@@ -0,0 +1,183 @@
+# Copyright (c) 2020 Simons Observatory.
+# Full license can be found in the top level "LICENSE" file.
+"""Test HWP synchronous signal simulation.
+"""
+import os
+import pickle
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from unittest import TestCase
+
+from ._helpers import create_outdir
+
+from sotodlib.sim_hardware import get_example
+
+from sotodlib.sim_hardware import sim_telescope_detectors
+
+
+toast_available = None
+if toast_available is None:
+    try:
+        import toast
+        import toast.qarray as qa
+        from toast.mpi import MPI, get_world
+        from toast.todmap import TODGround
+        from sotodlib.toast.sim_hwpss import OpSimHWPSS
+        toast_available = True
+    except ImportError:
+        toast_available = False
+
+
+def reference_hwpss(tod, focalplane, thetas, chis, all_stokes):
+    """Observe the HWPSS one detector and Stokes parameter at a time."""
+    freqs = {
+        "SAT_f030" : "027",
+        "SAT_f040" : "039",
+    }
+    chi = tod.local_hwp_angle()
+    result = dict()
+    for det in tod.local_dets:
+        stokes = all_stokes[freqs[focalplane[det]["band"]]]
+        det_theta, det_phi, det_psi = qa.to_angles(focalplane[det]["quat"])
+        azelquat = tod.read_pntg(detector=det, azel=True)
+        el = np.pi / 2 - qa.to_position(azelquat)[0]
+        weights = [1.0, np.cos(2 * det_psi), np.sin(2 * det_psi)]
+
+        theta_deg = np.degrees(det_theta)
+        itheta_high = np.searchsorted(thetas, theta_deg)
+        itheta_low = itheta_high - 1
+        r = (theta_deg - thetas[itheta_low]) \
+            / (thetas[itheta_high] - thetas[itheta_low])
+        profile = dict()
+        for kind in "transmission", "reflection", "emission":
+            profile[kind] = (
+                (1 - r) * stokes[kind][itheta_low]
+                + r * stokes[kind][itheta_high]
+            ).T
+        scale = np.sin(np.radians(50)) / np.sin(el)
+
+        iquss = np.zeros(len(chi))
+        for i, w in enumerate(weights):
+            iquss += w * scale * np.interp(
+                chi, chis,
+                profile["transmission"][i] + profile["reflection"][i])
+            iquss += w * np.interp(chi, chis, profile["emission"][i])
+        iquss -= np.median(iquss)
+        result[det] = iquss
+    return result
+
+
+class ToastHWPSSTest(TestCase):
+
+    def setUp(self):
+        fixture_name = os.path.splitext(os.path.basename(__file__))[0]
+        if not toast_available:
+            print("toast cannot be imported- skipping unit tests", flush=True)
+            return
+
+        self.comm, self.procs, self.rank = get_world()
+
+        self.outdir = create_outdir(fixture_name, comm=self.comm)
+
+        toastcomm = toast.Comm()
+        self.data = toast.Data(toastcomm)
+
+        # Focalplane
+        hwfull = get_example()
+        dets = sim_telescope_detectors(hwfull, "SAT4")
+        hwfull.data["detectors"] = dets
+        hw = hwfull.select(
+            match={"wafer_slot": "w42", "band": "SAT_f030", "pixel": "00[01]"})
+        self.focalplane = hw.data["detectors"]
+        detquats = {k: v["quat"] for k, v in self.focalplane.items()}
+
+        # A small HWPSS database with smooth random profiles in two bands
+        self.thetas = np.linspace(0.0, 40.0, 41)
+        self.chis = np.linspace(0.0, 2 * np.pi, 181)
+        np.random.seed(123456)
+        self.all_stokes = dict()
+        for freq in "027", "039":
+            self.all_stokes[freq] = dict()
+            for kind in "transmission", "reflection", "emission":
+                amp = np.random.uniform(0.5, 1.5, (len(self.thetas), 1, 4))
+                phase = np.random.uniform(0, np.pi, (1, 1, 4))
+                self.all_stokes[freq][kind] = amp * np.cos(
+                    4 * self.chis[None, :, None] + phase)
+        self.fname_hwpss = os.path.join(self.outdir, "hwpss.pck")
+        if self.rank == 0:
+            with open(self.fname_hwpss, "wb") as fout:
+                pickle.dump((self.thetas, self.chis, self.all_stokes), fout)
+        if self.comm is not None:
+            self.comm.barrier()
+
+        self.rate = 100.0
+        self.totsamp = 10000
+        tod = TODGround(
+            self.data.comm.comm_group,
+            detquats,
+            self.totsamp,
+            detranks=self.data.comm.group_size,
+            firsttime=0.0,
+            rate=self.rate,
+            site_lon='-67:47:10',
+            site_lat='-22:57:30',
+            site_alt=5200.,
+            azmin=45,
+            azmax=55,
+            el=60,
+            scanrate=1.0,
+            scan_accel=0.1,
+            hwprpm=120.0,
+        )
+
+        obs = dict()
+        obs["tod"] = tod
+        obs["focalplane"] = self.focalplane
+        obs["id"] = 12345
+        obs["name"] = "test"
+        self.data.obs.append(obs)
+        return
+
+    def reset_signal(self, tod):
+        for det in tod.local_dets:
+            tod.cache.put("hwpss_{}".format(det),
+                          np.zeros(tod.local_samples[1]), replace=True)
+
+    def check_signal(self, tod, focalplane, nexec):
+        ref = reference_hwpss(tod, focalplane, self.thetas, self.chis,
+                              self.all_stokes)
+        for det in tod.local_dets:
+            # The operator works in single precision
+            atol = 1.0e-5 * nexec * np.amax(np.abs(ref[det]))
+            assert_allclose(tod.local_signal(det, "hwpss"), nexec * ref[det],
+                            rtol=0, atol=atol)
+
+    def test_exec(self):
+        if not toast_available:
+            return
+
+        tod = self.data.obs[0]["tod"]
+        self.reset_signal(tod)
+
+        op = OpSimHWPSS("hwpss", self.fname_hwpss)
+        op.exec(self.data)
+        self.check_signal(tod, self.focalplane, 1)
+
+        # A second call with the same focalplane adds the same signal again
+        op.exec(self.data)
+        self.check_signal(tod, self.focalplane, 2)
+
+        # A fresh focalplane with other bands must not reuse the detector
+        # tables of the first one.
+        del self.data.obs[0]["focalplane"]
+        focalplane = {
+            det: dict(props, band="SAT_f040")
+            for det, props in self.focalplane.items()
+        }
+        self.data.obs[0]["focalplane"] = focalplane
+        self.reset_signal(tod)
+        op.exec(self.data)
+        self.check_signal(tod, focalplane, 1)
+        return
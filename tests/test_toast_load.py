@@ -34,7 +34,10 @@ if toast_available is None:
         from toast.todmap import TODGround
         from toast.tod import AnalyticNoise
         from sotodlib.toast.export import ToastExport
-        from sotodlib.toast.load import load_data
+        from sotodlib.toast.load import (
+            load_data, _frame_intervals, _observation_weights,
+            _scan_frame_file, _scan_frame_files
+        )
         toast_available = True
     except ImportError:
         toast_available = False
@@ -162,6 +165,105 @@ class ToastLoadTest(TestCase):
 
         return
 
+    def test_frame_intervals(self):
+        if not toast_available:
+            return
+
+        # Four frames of 100 samples, with a process holding the samples of
+        # the middle two.
+        frame_sizes_by_offset = {0: 100, 100: 100, 200: 100, 300: 100}
+        local_offset = 100
+        nsample = 200
+        times = 1000.0 + 0.01 * np.arange(local_offset,
+                                          local_offset + nsample)
+
+        intervals = _frame_intervals(frame_sizes_by_offset, times,
+                                     local_offset, nsample)
+        assert_equal(len(intervals), 4)
+        assert_equal([x.first for x in intervals], [0, 100, 200, 300])
+        assert_equal([x.last for x in intervals], [99, 199, 299, 399])
+        # Frames outside the local range have no time stamps
+        for ival in intervals[0], intervals[3]:
+            assert_equal((ival.start, ival.stop), (0, 0))
+        # The local frames start and stop at their own time stamps
+        assert_allclose([intervals[1].start, intervals[1].stop],
+                        [1001.0, 1001.99])
+        assert_allclose([intervals[2].start, intervals[2].stop],
+                        [1002.0, 1002.99])
+        return
+
+    def test_observation_weights(self):
+        if not toast_available:
+            return
+        if self.rank != 0:
+            return
+
+        # Observation directories with frame files of different sizes
+        wdir = os.path.join(self.outdir, "weights")
+        sizes = {"obs_a": 1000000, "obs_b": 3000000, "obs_c": 2000000}
+        for ob, size in sizes.items():
+            obdir = os.path.join(wdir, ob)
+            os.makedirs(obdir, exist_ok=True)
+            with open(os.path.join(obdir, "so_00000000.g3"), "wb") as f:
+                f.write(b"\0" * size)
+
+        obslist, dweight = _observation_weights(wdir, prefix="so")
+        assert_equal(obslist, ["obs_a", "obs_b", "obs_c"])
+        assert_allclose(dweight, [1.0, 3.0, 2.0])
+
+        obslist, dweight = _observation_weights(
+            wdir, obs=["obs_c", "obs_a"], prefix="so")
+        assert_equal(obslist, ["obs_a", "obs_c"])
+        assert_allclose(dweight, [1.0, 2.0])
+        return
+
+    def test_scan_frame_files(self):
+        if not toast_available:
+            return
+
+        tod = self.data.obs[0]["tod"]
+
+        # Dump to disk, in several files
+        outdir = self.outdir + "_scan"
+        prefix = "sat4"
+        dumper = ToastExport(
+            outdir,
+            prefix=prefix,
+            use_intervals=True,
+            cache_name="signal",
+            mask_flag_common=tod.TURNAROUND,
+            filesize=self.dumpsize // 4,
+            units=core3g.G3TimestreamUnits.Tcmb,
+            verbose=False,
+        )
+        dumper.exec(self.data)
+
+        obsdir = os.path.join(outdir, self.data.obs[0]["name"])
+        file_offsets = [
+            (f, int(os.path.basename(f)[len(prefix) + 1 : -3]))
+            for f in sorted(glob("{}/{}_*.g3".format(obsdir, prefix)))
+        ]
+        self.assertTrue(len(file_offsets) > 1)
+        first_offset = file_offsets[0][1]
+
+        # The distributed scan must be merged back in file order, matching
+        # a serial scan of every file.
+        serial = [
+            _scan_frame_file(ffile, fsampoff, first_offset)
+            for ffile, fsampoff in file_offsets
+        ]
+        for comm in None, self.data.comm.comm_group:
+            scanned = _scan_frame_files(file_offsets, first_offset, comm)
+            assert_equal(len(scanned), len(serial))
+            for check, ref in zip(scanned, serial):
+                assert_equal(check[0], ref[0])
+                assert_equal(check[1], ref[1])
+                assert_array_equal(check[2], ref[2])
+                assert_equal(check[3], ref[3])
+                assert_equal(check[4] is None, ref[4] is None)
+                assert_equal(len(check[5]), len(ref[5]))
+        return
+
     # def test_load(self):
     #     if not toast_available:
     #         return